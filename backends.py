@@ -0,0 +1,134 @@
+import json
+
+from prompts import encode_payload
+
+CHAT_URL = "https://openchat.team/api/chat"
+
+
+class OpenChatBackend:
+    name = "openchat"
+
+    def __init__(
+        self,
+        url=CHAT_URL,
+        model_id="openchat_v3.2_mistral",
+        model_name="OpenChat Aura",
+        token_limit=8192,
+    ):
+        self.url = url
+        self.model_id = model_id
+        self.model_name = model_name
+        self.token_limit = token_limit
+        self.headers = {"Content-Type": "application/json"}
+
+    def build_payload(self, prompt_text, temperature, max_length):
+        return {
+            "model": {
+                "id": self.model_id,
+                "name": self.model_name,
+                "maxLength": max_length,
+                "tokenLimit": self.token_limit,
+            },
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt_text,
+                }
+            ],
+            "key": "",
+            "prompt": " ",
+            "temperature": temperature,
+        }
+
+    def limits(self, payload):
+        return payload["model"]["tokenLimit"], payload["model"]["maxLength"]
+
+    def prepare(self, payload, stream):
+        return payload
+
+    def encode(self, payload, stream):
+        return encode_payload(self.prepare(payload, stream))
+
+    def parse_response(self, text):
+        return text
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url="http://localhost:8000/v1",
+        model="openchat_3.5",
+        api_key=None,
+        token_limit=8192,
+        max_length=30000,
+        max_tokens=1024,
+    ):
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.model = model
+        self.token_limit = token_limit
+        self.max_length = max_length
+        self.max_tokens = max_tokens
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+
+    def build_payload(self, prompt_text, temperature, max_length):
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt_text,
+                }
+            ],
+            "temperature": temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+    def limits(self, payload):
+        return self.token_limit, self.max_length
+
+    def prepare(self, payload, stream):
+        return {**payload, "stream": True} if stream else payload
+
+    def encode(self, payload, stream):
+        return encode_payload(self.prepare(payload, stream))
+
+    def parse_response(self, text):
+        if text.lstrip().startswith("data:"):
+            content = []
+            for line in text.splitlines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                content.append(delta.get("content") or "")
+            return "".join(content)
+        return json.loads(text)["choices"][0]["message"]["content"]
+
+
+DEFAULT_BACKEND = OpenChatBackend()
+
+
+def add_backend_arguments(parser):
+    parser.add_argument("--backend", choices=["openchat", "openai"], default="openchat")
+    parser.add_argument("--base-url", default=None)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--api-key", default=None)
+
+
+def make_backend(args):
+    if args.backend == "openai":
+        options = {"base_url": args.base_url, "model": args.model}
+        return OpenAIBackend(
+            **{key: value for key, value in options.items() if value is not None},
+            api_key=args.api_key,
+        )
+    options = {"url": args.base_url, "model_id": args.model}
+    return OpenChatBackend(
+        **{key: value for key, value in options.items() if value is not None}
+    )
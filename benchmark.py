@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import async_to_sync
+
+import cot_summarization
+import evaluate
+import summarization
+from backends import OpenAIBackend, OpenChatBackend
+from client import percentile
+from mock_server import MockServer
+from rate_limit import RateLimiter
+
+STRATEGIES = [
+    *("{}-{}".format(*configuration) for configuration in summarization.CONFIGURATIONS),
+    "chain_of_thought",
+    "chain_of_thought-tree",
+    "evaluation",
+]
+VOCABULARY = [
+    "model",
+    "summary",
+    "paper",
+    "results",
+    "method",
+    "training",
+    "evaluation",
+    "language",
+    "attention",
+    "dataset",
+    "baseline",
+    "performance",
+    "section",
+    "we",
+    "propose",
+    "show",
+    "that",
+    "the",
+    "a",
+    "of",
+    "in",
+    "and",
+    "large",
+    "improves",
+]
+COMPARED = ["requests_per_second", "papers_per_minute", "latency_p95", "peak_rss_mb"]
+
+
+def synthetic_text(rng, words):
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentences.append(" ".join(rng.choices(VOCABULARY, k=length)).capitalize())
+        words -= length
+    return ". ".join(sentences) + "."
+
+
+def synthetic_corpus(papers, sections, words, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "title": f"Synthetic paper {idx}",
+            "summary": synthetic_text(rng, 120),
+            "document": [
+                {"subtitle": f"Section {section}", "text": synthetic_text(rng, words)}
+                for section in range(sections)
+            ],
+            "url": f"https://example.org/paper/{idx}",
+            "id": f"paper-{idx}",
+        }
+        for idx in range(papers)
+    ]
+
+
+def run_strategy(strategy, papers, options):
+    if strategy.startswith("chain_of_thought"):
+        mode = "tree" if strategy.endswith("-tree") else "linear"
+        async_to_sync(cot_summarization.summarize_corpus)(
+            papers, lambda result_dict: None, mode=mode, **options
+        )
+    elif strategy == "evaluation":
+        evaluate.get_summary_evals(
+            [
+                {
+                    "id": paper["id"],
+                    "gt_summary": paper["summary"],
+                    "pred_summary": paper["document"][0]["text"][:600],
+                }
+                for paper in papers
+            ],
+            **options,
+        )
+    else:
+        summarization.get_summaries(papers, *strategy.split("-"), **options)
+
+
+def measure(strategy, papers, sections, words, backend, limiter_options):
+    corpus = synthetic_corpus(papers, sections, words)
+    with tempfile.TemporaryDirectory() as directory:
+        call_log = os.path.join(directory, "calls.jsonl")
+        started = time.perf_counter()
+        run_strategy(
+            strategy,
+            corpus,
+            {
+                "backend": backend,
+                "limiter": RateLimiter(**limiter_options),
+                "call_log": call_log,
+            },
+        )
+        elapsed = time.perf_counter() - started
+        with open(call_log, "r", encoding="utf-8") as file:
+            records = [json.loads(line) for line in file]
+
+    latencies = [record["latency"] for record in records if record["latency"]]
+    return {
+        "strategy": strategy,
+        "papers": papers,
+        "sections": sections,
+        "words": words,
+        "elapsed": round(elapsed, 3),
+        "requests": len(records),
+        "succeeded": sum(record["status"] == 200 for record in records),
+        "requests_per_second": round(len(records) / elapsed, 3),
+        "papers_per_minute": round(papers / elapsed * 60, 3),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "input_tokens": sum(record["input_tokens"] for record in records),
+        "output_tokens": sum(record["output_tokens"] or 0 for record in records),
+        "bytes": sum(record["bytes"] or 0 for record in records),
+    }
+
+
+def git_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(**options):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server = MockServer(**options)
+    asyncio.run_coroutine_threadsafe(server.__aenter__(), loop).result()
+    return server, loop
+
+
+def stop_server(server, loop):
+    asyncio.run_coroutine_threadsafe(server.__aexit__(None, None, None), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = {
+            (row["strategy"], row["papers"], row["sections"], row["words"]): row
+            for row in json.load(file)["results"]
+        }
+    for row in results:
+        before = baseline.get(
+            (row["strategy"], row["papers"], row["sections"], row["words"])
+        )
+        if before is None:
+            continue
+        changes = {
+            metric: round(row[metric] / before[metric], 3)
+            for metric in COMPARED
+            if row[metric] and before[metric]
+        }
+        print(f"{row['strategy']} {row['papers']}x{row['sections']}: {changes}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--strategies", nargs="+", choices=STRATEGIES, default=STRATEGIES
+    )
+    parser.add_argument("--papers", nargs="+", type=int, default=[4, 16])
+    parser.add_argument("--sections", nargs="+", type=int, default=[4, 16])
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--backend", choices=["openchat", "openai"], default="openchat")
+    parser.add_argument("--requests-per-second", type=float, default=100.0)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    server, loop = start_server(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate
+    )
+    if args.backend == "openai":
+        backend = OpenAIBackend(base_url=f"{server.url}/v1")
+    else:
+        backend = OpenChatBackend(url=f"{server.url}/api/chat")
+    limiter_options = {
+        "requests_per_second": args.requests_per_second,
+        "burst": args.max_concurrency,
+        "max_concurrency": args.max_concurrency,
+    }
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for strategy, papers, sections in itertools.product(
+        args.strategies, args.papers, args.sections
+    ):
+        # A fresh interpreter per run keeps peak RSS attributable to one run.
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(
+                measure,
+                strategy,
+                papers,
+                sections,
+                args.words,
+                backend,
+                limiter_options,
+            ).result()
+        results.append(result)
+        print(json.dumps(result))
+    stop_server(server, loop)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "version": git_version(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "settings": vars(args),
+                "results": results,
+            },
+            file,
+            indent=4,
+        )
+    print(f"Wrote {len(results)} results to {args.output}")
+    if args.compare is not None:
+        compare(results, args.compare)
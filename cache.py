@@ -0,0 +1,131 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path="responses.sqlite",
+        max_bytes=None,
+        max_age=None,
+        replay=False,
+        commit_every=64,
+        commit_interval=1.0,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.replay = replay
+        # Lookups and writes run on the event loop, so commits are batched:
+        # at most every commit_every changes or commit_interval seconds.
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.accessed = {}
+        self.pending = 0
+        self.committed = time.monotonic()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.commit()
+        if not replay:
+            self.evict()
+
+    @staticmethod
+    def key(payload, url=None):
+        # The endpoint is part of the key: the same model name served by two
+        # backends does not give interchangeable responses.
+        model = payload["model"]
+        canonical = json.dumps(
+            {
+                "url": url,
+                "model": model["id"] if isinstance(model, dict) else model,
+                "messages": payload["messages"],
+                "temperature": payload.get("temperature"),
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, payload, url=None):
+        key = self.key(payload, url)
+        row = self.connection.execute(
+            "SELECT response, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (
+            self.max_age is not None and time.time() - row[1] > self.max_age
+        ):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        if not self.replay:
+            self.accessed[key] = time.time()
+            self._changed()
+        return row[0]
+
+    def put(self, payload, response, url=None):
+        if self.replay or response is None:
+            return
+        key = self.key(payload, url)
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (key, response, len(response.encode("utf-8")), now, now),
+        )
+        self.accessed.pop(key, None)
+        self.stats["writes"] += 1
+        self._changed()
+
+    def _changed(self):
+        self.pending += 1
+        if (
+            self.pending >= self.commit_every
+            or time.monotonic() - self.committed >= self.commit_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        if self.accessed:
+            self.connection.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self.accessed.items()],
+            )
+            self.accessed = {}
+        self.connection.commit()
+        self.pending = 0
+        self.committed = time.monotonic()
+
+    def evict(self):
+        self.flush()
+        evicted = 0
+        if self.max_age is not None:
+            evicted += self.connection.execute(
+                "DELETE FROM responses WHERE created < ?",
+                (time.time() - self.max_age,),
+            ).rowcount
+        if self.max_bytes is not None:
+            total = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            for key, size in self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        self.connection.commit()
+        self.stats["evicted"] += evicted
+        return evicted
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,64 @@
+import json
+import os
+import textwrap
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                torn = file.read(1) != b"\n"
+            if torn:
+                with open(path, "ab") as file:
+                    file.write(b"\n")
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _scan(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as file:
+            offset = 0
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if record is not None:
+                    yield offset, record
+                offset += len(line)
+
+    def completed_ids(self, **match):
+        return {
+            record["id"]
+            for _, record in self._scan()
+            if all(record.get(key) == value for key, value in match.items())
+        }
+
+    def append(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def export(self, path, ids=None, encoding="utf-16"):
+        self.file.flush()
+        offsets = {record["id"]: offset for offset, record in self._scan()}
+        if ids is None:
+            ids = offsets
+        with open(self.path, "rb") as source, open(
+            path, "w", encoding=encoding
+        ) as file:
+            file.write("[")
+            first = True
+            for paper_id in ids:
+                if paper_id not in offsets:
+                    continue
+                source.seek(offsets[paper_id])
+                record = json.loads(source.readline())
+                file.write("\n" if first else ",\n")
+                file.write(textwrap.indent(json.dumps(record, indent=4), "    "))
+                first = False
+            file.write("]" if first else "\n]")
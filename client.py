@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+from backends import DEFAULT_BACKEND, add_backend_arguments, make_backend
+from cache import ResponseCache
+from failures import RequestFailed, classify
+from instrumentation import get_tracer, trace_fields
+from rate_limit import THROTTLE_STATUSES, RateLimiter, parse_retry_after
+
+RETRY_STATUSES = {500, 502, 504}
+
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4 if text else 0
+
+
+def at_least_one(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def positive(value):
+    value = float(value)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be positive, got {value}")
+    return value
+
+
+def add_client_arguments(parser):
+    add_backend_arguments(parser)
+    parser.add_argument("--cache", default="responses.sqlite")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--cache-max-bytes", type=at_least_one, default=None)
+    parser.add_argument("--cache-max-age", type=positive, default=None)
+    parser.add_argument("--replay", action="store_true")
+    parser.add_argument("--max-concurrency", type=at_least_one, default=32)
+    parser.add_argument("--requests-per-second", type=positive, default=5.0)
+    parser.add_argument("--max-requests-per-second", type=positive, default=None)
+    parser.add_argument("--burst", type=at_least_one, default=10)
+    parser.add_argument("--limit-per-host", type=int, default=16)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--call-log", default=None)
+    parser.add_argument("--dedupe", action="store_true")
+    parser.add_argument("--dedupe-temperature", action="store_true")
+    parser.add_argument("--retry-attempts", type=at_least_one, default=5)
+    parser.add_argument("--request-timeout", type=float, default=600.0)
+
+
+def client_options(args):
+    return {
+        "backend": make_backend(args),
+        "cache": (
+            None
+            if args.no_cache
+            else ResponseCache(
+                args.cache,
+                max_bytes=args.cache_max_bytes,
+                max_age=args.cache_max_age,
+                replay=args.replay,
+            )
+        ),
+        "max_concurrency": args.max_concurrency,
+        "requests_per_second": args.requests_per_second,
+        "max_requests_per_second": args.max_requests_per_second,
+        "burst": args.burst,
+        "limit_per_host": args.limit_per_host,
+        "stream": args.stream,
+        "call_log": args.call_log,
+        "dedupe": args.dedupe,
+        "dedupe_temperature": args.dedupe_temperature,
+        "retry_attempts": args.retry_attempts,
+        "request_timeout": args.request_timeout,
+    }
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Reservoir:
+    # A bounded uniform sample of a stream, so percentiles do not need every
+    # call of a long run in memory.
+    def __init__(self, size=4096, seed=0):
+        self.size = size
+        self.values = []
+        self.seen = 0
+        self.rng = random.Random(seed)
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        idx = self.rng.randrange(self.seen)
+        if idx < self.size:
+            self.values[idx] = value
+
+
+class ChatClient:
+    def __init__(
+        self,
+        backend=DEFAULT_BACKEND,
+        limit_per_host=16,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+        retry_attempts=5,
+        max_concurrency=32,
+        requests_per_second=5.0,
+        max_requests_per_second=None,
+        burst=10,
+        limiter=None,
+        cache=None,
+        stream=False,
+        call_log=None,
+        dedupe=False,
+        dedupe_temperature=False,
+        request_timeout=600.0,
+    ):
+        self.backend = backend
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        if retry_attempts < 1:
+            raise ValueError(f"retry_attempts must be at least 1, got {retry_attempts}")
+        self.retry_attempts = retry_attempts
+        self.limiter = limiter or RateLimiter(
+            requests_per_second=requests_per_second,
+            burst=burst,
+            max_concurrency=max_concurrency,
+            max_requests_per_second=max_requests_per_second,
+        )
+        self.cache = cache
+        self.stream = stream
+        self.call_log = call_log
+        self.dedupe = dedupe
+        self.dedupe_temperature = dedupe_temperature
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout)
+        self.shared = {}
+        self.deduplicated = 0
+        self.totals = dict.fromkeys(
+            [
+                "calls",
+                "succeeded",
+                "bytes",
+                "sent_bytes",
+                "input_tokens",
+                "output_tokens",
+                "latency",
+                "queued",
+            ],
+            0,
+        )
+        self.latencies = Reservoir()
+        self.ttfts = Reservoir()
+        self.log = None
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+        if self.call_log is not None:
+            self.log = open(self.call_log, "a", encoding="utf-8")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+        if self.cache is not None and not self.cache.replay:
+            # Commits what is still batched and applies the size and age
+            # limits to what this run added.
+            self.cache.evict()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    async def post(self, payload):
+        if not self.dedupe:
+            return await self._post(payload)
+        # Identical calls that overlap in time share a single request; with
+        # dedupe_temperature, calls that differ only in temperature count as
+        # identical too. A finished request is forgotten, so the client holds
+        # no responses (that is the cache's job), and a failure reaches every
+        # caller that shared it.
+        key = ResponseCache.key(
+            {**payload, "temperature": None} if self.dedupe_temperature else payload,
+            self.backend.url,
+        )
+        task = self.shared.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._post(payload))
+            self.shared[key] = task
+            task.add_done_callback(lambda task: self.shared.pop(key, None))
+        else:
+            self.deduplicated += 1
+        return await asyncio.shield(task)
+
+    async def _post(self, payload):
+        if self.cache is None:
+            return await self._send(payload)
+        response = self.cache.get(payload, self.backend.url)
+        get_tracer().emit("llm_cache", hit=response is not None)
+        if response is not None:
+            return response
+        if self.cache.replay:
+            raise RequestFailed("cache_miss", "no cached response in replay mode")
+        response = await self._send(payload)
+        self.cache.put(payload, response, self.backend.url)
+        return response
+
+    async def _read(self, response, record, sent):
+        if not self.stream:
+            text = await response.text()
+            # Without streaming the first token is not observable.
+            record["latency"] = time.monotonic() - sent
+            record["bytes"] = len(text.encode("utf-8"))
+            return text
+
+        chunks = []
+        async for chunk in response.content.iter_any():
+            if not chunks:
+                record["ttft"] = time.monotonic() - sent
+            chunks.append(chunk)
+        record["latency"] = time.monotonic() - sent
+        body = b"".join(chunks)
+        record["bytes"] = len(body)
+        return body.decode(response.charset or "utf-8")
+
+    async def _send(self, payload):
+        body = self.backend.encode(payload, self.stream)
+        queued = time.monotonic()
+        failure = None
+        for attempt in range(self.retry_attempts):
+            async with self.limiter:
+                sent = time.monotonic()
+                record = {
+                    **trace_fields(),
+                    "attempt": attempt + 1,
+                    "queued": sent - queued,
+                    "ttft": None,
+                    "latency": None,
+                    "bytes": 0,
+                    "sent_bytes": len(body),
+                    "input_tokens": sum(
+                        estimate_tokens(message["content"])
+                        for message in payload["messages"]
+                    ),
+                    "output_tokens": 0,
+                    "status": None,
+                    "retry_reason": None,
+                    "error": None,
+                }
+                try:
+                    async with self.session.post(
+                        self.backend.url,
+                        data=body,
+                        headers=self.backend.headers,
+                        timeout=self.timeout,
+                    ) as response:
+                        record["status"] = response.status
+                        if response.status == 200:
+                            self.limiter.reward()
+                            body_text = await self._read(response, record, sent)
+                            try:
+                                text = self.backend.parse_response(body_text)
+                            except Exception as e:
+                                record["error"] = repr(e)
+                                raise RequestFailed(
+                                    "invalid_response", repr(e), 200, attempt + 1
+                                ) from e
+                            record["output_tokens"] = estimate_tokens(text)
+                            return text
+                        record["latency"] = time.monotonic() - sent
+                        record["error"] = f"HTTP {response.status}"
+                        if response.status in THROTTLE_STATUSES:
+                            record["retry_reason"] = "throttled"
+                            self.limiter.penalize(
+                                parse_retry_after(response.headers.get("Retry-After"))
+                            )
+                            failure = ("throttled", record["error"], response.status)
+                            continue
+                        if response.status not in RETRY_STATUSES:
+                            raise RequestFailed(
+                                "client_error",
+                                record["error"],
+                                response.status,
+                                attempt + 1,
+                            )
+                        record["retry_reason"] = "server_error"
+                        failure = ("server_error", record["error"], response.status)
+                except (
+                    asyncio.TimeoutError,
+                    aiohttp.ClientConnectionError,
+                    aiohttp.ClientPayloadError,
+                ) as e:
+                    # Timeouts and dropped or reset connections, including
+                    # ones that break a response body mid-read, are retried.
+                    record["error"] = str(e) or repr(e)
+                    record["retry_reason"] = classify(e)
+                    failure = (classify(e), record["error"], None)
+                finally:
+                    self._finish(record)
+            await asyncio.sleep(0.1 * 2**attempt)
+            queued = time.monotonic()
+        raise RequestFailed(*failure, self.retry_attempts)
+
+    def _finish(self, record):
+        get_tracer().emit("llm_call", **record)
+        if self.log is not None:
+            # One line per attempt as it completes, so a crash keeps the log.
+            self.log.write(json.dumps(record) + "\n")
+            self.log.flush()
+        totals = self.totals
+        totals["calls"] += 1
+        totals["sent_bytes"] += record["sent_bytes"]
+        totals["input_tokens"] += record["input_tokens"]
+        totals["queued"] += record["queued"]
+        if record["status"] == 200 and record["error"] is None:
+            totals["succeeded"] += 1
+            totals["bytes"] += record["bytes"]
+            totals["output_tokens"] += record["output_tokens"]
+            totals["latency"] += record["latency"]
+            self.latencies.add(record["latency"])
+            if record["ttft"] is not None:
+                self.ttfts.add(record["ttft"])
+
+    def report(self):
+        totals = self.totals
+        report = {
+            "rate_limiter": self.limiter.report(),
+            "calls": totals["calls"],
+            "succeeded": totals["succeeded"],
+            "deduplicated": self.deduplicated,
+            "bytes": totals["bytes"],
+            "sent_bytes": totals["sent_bytes"],
+            "input_tokens": totals["input_tokens"],
+            "output_tokens": totals["output_tokens"],
+            "latency_mean": (
+                totals["latency"] / totals["succeeded"] if totals["succeeded"] else None
+            ),
+            "latency_p50": percentile(self.latencies.values, 0.5),
+            "latency_p95": percentile(self.latencies.values, 0.95),
+            "ttft_p50": percentile(self.ttfts.values, 0.5),
+            "queued_mean": (
+                totals["queued"] / totals["calls"] if totals["calls"] else None
+            ),
+        }
+        if self.cache is not None:
+            report["cache"] = self.cache.stats
+        return report
@@ -0,0 +1,112 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+
+def index_path(path):
+    return f"{path}.idx"
+
+
+def write_corpus(papers, path):
+    line_offsets = array("Q")
+    paper_lines = array("Q")
+    offset = 0
+    with open(path, "wb") as file:
+        for paper in papers:
+            header = {key: value for key, value in paper.items() if key != "document"}
+            header["sections"] = len(paper["document"])
+            paper_lines.append(len(line_offsets))
+            for record in [header, *paper["document"]]:
+                line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+                line_offsets.append(offset)
+                file.write(line)
+                offset += len(line)
+    paper_lines.append(len(line_offsets))
+    line_offsets.append(offset)
+
+    with open(index_path(path), "wb") as file:
+        file.write(struct.pack("Q", len(paper_lines) - 1))
+        paper_lines.tofile(file)
+        line_offsets.tofile(file)
+
+
+def convert(json_path, path, encoding="utf-16"):
+    with open(json_path, "r", encoding=encoding) as file:
+        write_corpus(json.load(file), path)
+
+
+class Corpus:
+    def __init__(self, path):
+        self.path = path
+        with open(index_path(path), "rb") as file:
+            self.index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (self.size,) = struct.unpack_from("Q", self.index)
+        self.paper_lines = memoryview(self.index)[8 : 8 + 8 * (self.size + 1)].cast("Q")
+        self.line_offsets = memoryview(self.index)[8 + 8 * (self.size + 1) :].cast("Q")
+        self.data = None
+        if os.path.getsize(path) > 0:
+            with open(path, "rb") as file:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.positions = None
+
+    def __len__(self):
+        return self.size
+
+    def _line(self, line):
+        return json.loads(
+            self.data[self.line_offsets[line] : self.line_offsets[line + 1]]
+        )
+
+    def header(self, idx):
+        return self._line(self.paper_lines[idx])
+
+    def section(self, idx, section_idx):
+        if not 0 <= section_idx < self.paper_lines[idx + 1] - self.paper_lines[idx] - 1:
+            raise IndexError(section_idx)
+        return self._line(self.paper_lines[idx] + 1 + section_idx)
+
+    def sections(self, idx):
+        for line in range(self.paper_lines[idx] + 1, self.paper_lines[idx + 1]):
+            yield self._line(line)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError(idx)
+        paper = self.header(idx)
+        del paper["sections"]
+        paper["document"] = list(self.sections(idx))
+        return paper
+
+    def __iter__(self):
+        for idx in range(self.size):
+            yield self[idx]
+
+    def ids(self):
+        return [self.header(idx)["id"] for idx in range(self.size)]
+
+    def position(self, paper_id):
+        if self.positions is None:
+            self.positions = {paper_id: idx for idx, paper_id in enumerate(self.ids())}
+        return self.positions[paper_id]
+
+
+def load_corpus(path):
+    if path.endswith(".json"):
+        json_path, path = path, f"{path[:-5]}.jsonl"
+        if not os.path.exists(index_path(path)) or os.path.getmtime(
+            json_path
+        ) > os.path.getmtime(index_path(path)):
+            convert(json_path, path)
+    return Corpus(path)
+
+
+if __name__ == "__main__":
+    json_path = sys.argv[1] if len(sys.argv) > 1 else "papers.json"
+    path = sys.argv[2] if len(sys.argv) > 2 else f"{json_path[:-5]}.jsonl"
+    convert(json_path, path)
+    print(f"Wrote {len(Corpus(path))} papers to {path}")
@@ -1,77 +1,410 @@
-from multiprocessing.pool import Pool
-import requests
-import json
-import time
-
-
-def generate_payload(text, current_summary, step):
-    if step == "chain_of_thought":
-        prompt_text = f"""Your job is to produce a final summary\n\nWe have provided an existing summary up to a certain point: {current_summary}\nWe have the opportunity to refine the existing summary (only if needed) with some more context below.\n------------\n{text}\n------------\nGiven the new context, refine the original summary\nIf the context isn't useful, return the original summary."""
-    elif step == "base_summary":
-        prompt_text = f"""Your job is to produce summaries\n\nWrite a concise summary of the following:\n\n------------\n{text}\n------------\n"""
-    return {
-        "model": {
-            "id": "openchat_v3.2_mistral",
-            "name": "OpenChat Aura",
-            "maxLength": 30000,
-            "tokenLimit": 8192,
-        },
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt_text,
-            }
-        ],
-        "key": "",
-        "prompt": " ",
-        "temperature": 0.3,
-    }
-
-
-def summarization_task(paper):
+import argparse
+import asyncio
+import difflib
+import os
+import re
+
+from asgiref.sync import async_to_sync
+from tqdm import tqdm
+
+from backends import DEFAULT_BACKEND
+from checkpoint import Checkpoint
+from client import ChatClient, add_client_arguments, client_options
+from corpus import load_corpus
+from dedup import dedupe_indices, load_changed_ids
+from failures import DeadLetters, RequestFailed, add_failure_arguments, describe
+from instrumentation import (
+    add_instrumentation_arguments,
+    get_tracer,
+    instrumented,
+    trace_context,
+    traced,
+)
+from prompts import add_prompt_arguments, get_template, load_prompts, register
+from scheduler import run_bounded
+
+# Whole headings only, optionally numbered ("IX Acknowledgements"), so a
+# section such as "Funding Allocation Model" is never taken for boilerplate.
+SKIPPED_SECTIONS = re.compile(
+    r"\s*(?:(?:\d+|[IVXLC]+|[A-Z])\.?\s+)?(?:references|bibliography"
+    r"|acknowledge?ments?|funding|author contributions|competing interests"
+    r"|conflicts? of interest)\s*[.:]?\s*",
+    re.IGNORECASE,
+)
+TERM = re.compile(r"[a-z][a-z0-9-]{3,}")
+STOPWORDS = {
+    "also",
+    "been",
+    "between",
+    "both",
+    "from",
+    "have",
+    "into",
+    "more",
+    "such",
+    "than",
+    "that",
+    "their",
+    "there",
+    "these",
+    "they",
+    "this",
+    "using",
+    "were",
+    "when",
+    "which",
+    "while",
+    "with",
+}
+MIN_NOVELTY = 0.0
+NO_OP_SIMILARITY = 0.9
+PATIENCE = 0
+
+register(
+    "chain_of_thought-base_summary",
+    """Your job is to produce summaries\n\nWrite a concise summary of the following:\n\n------------\n{text}\n------------\n""",
+    temperature=0.3,
+    max_length=30000,
+)
+
+register(
+    "chain_of_thought-chain_of_thought",
+    """Your job is to produce a final summary\n\nWe have provided an existing summary up to a certain point: {current_summary}\nWe have the opportunity to refine the existing summary (only if needed) with some more context below.\n------------\n{text}\n------------\nGiven the new context, refine the original summary\nIf the context isn't useful, return the original summary.""",
+    temperature=0.3,
+    max_length=30000,
+)
+
+
+def generate_payload(text, current_summary, step, backend=DEFAULT_BACKEND):
+    return get_template(f"chain_of_thought-{step}").payload(
+        backend, text=text, current_summary=current_summary
+    )
+
+
+def select_sections(paper, skip_boilerplate=False):
+    # Repeated text, such as a subsection nested inside its parent, is only
+    # sent once; indices stay positions in paper["document"].
+    kept, _ = dedupe_indices(paper["document"])
+    sections = [
+        (idx, paper["document"][idx])
+        for idx in kept
+        if paper["document"][idx]["text"].strip()
+    ]
+    if not sections:
+        # Dead-lettered like a failed request, instead of a "None" summary.
+        raise RequestFailed("no_text", "the paper has no section text")
+    if not skip_boilerplate:
+        return sections
+    return [
+        (idx, doc)
+        for idx, doc in sections
+        if not SKIPPED_SECTIONS.fullmatch(doc.get("subtitle") or "")
+    ] or sections
+
+
+def terms(text):
+    return set(TERM.findall(text.lower())) - STOPWORDS
+
+
+def novelty(text, known_terms):
+    # Share of the section's vocabulary the title and running summary do not
+    # cover yet; a section with nothing new has nothing to add to the summary.
+    section_terms = terms(text)
+    if not section_terms:
+        return 0.0
+    return len(section_terms - known_terms) / len(section_terms)
+
+
+def is_no_op(previous_summary, summary):
+    return (
+        difflib.SequenceMatcher(
+            None, previous_summary.split(), summary.split(), autojunk=False
+        ).ratio()
+        >= NO_OP_SIMILARITY
+    )
+
+
+def tree_calls(sections):
+    summaries, contexts = (sections + 1) // 2, sections // 2
+    calls = summaries
+    while contexts:
+        calls += contexts
+        refined = contexts + (summaries > contexts)
+        summaries, contexts = (refined + 1) // 2, refined // 2
+    return calls
+
+
+async def summarization_task(
+    client, paper, min_novelty=MIN_NOVELTY, patience=PATIENCE, skip_boilerplate=False
+):
+    sections = select_sections(paper, skip_boilerplate)
     previous_summary = ""
-    for idx, doc in enumerate(paper["document"]):
-        if idx == 0:
-            previous_summary = requests.post(
-                "https://openchat.team/api/chat",
-                json=generate_payload(doc["text"], "", "base_summary"),
-                headers={"Content-Type": "application/json"},
-            ).text
-        elif idx == len(paper["document"]) - 1:
-            result_dict = {}
-
-            result_dict["title"] = paper["title"]
-            result_dict["gt_summary"] = paper["summary"]
-            result_dict["id"] = paper["id"]
-            result_dict["extraction_type"] = "chain_of_thought"
-            result_dict["pred_summary"] = requests.post(
-                "https://openchat.team/api/chat",
-                json=generate_payload(
-                    doc["text"], previous_summary, "chain_of_thought"
-                ),
-                headers={"Content-Type": "application/json"},
-            ).text
-
-            return result_dict
-        else:
-            previous_summary = requests.post(
-                "https://openchat.team/api/chat",
-                json=generate_payload(
-                    doc["text"], previous_summary, "chain_of_thought"
+    calls = 0
+    no_ops = 0
+    failed = []
+    with trace_context(paper_id=paper["id"], stage="chain_of_thought"):
+        for idx, doc in sections:
+            # After a failed base summary the next section starts the chain.
+            step = "chain_of_thought" if previous_summary else "base_summary"
+            if step == "chain_of_thought":
+                if patience and no_ops >= patience:
+                    break
+                if (
+                    novelty(doc["text"], terms(f"{paper['title']} {previous_summary}"))
+                    < min_novelty
+                ):
+                    continue
+            calls += 1
+            try:
+                summary = await traced(
+                    client.post(
+                        generate_payload(
+                            doc["text"], previous_summary, step, client.backend
+                        )
+                    ),
+                    step=step,
+                    section=idx,
+                )
+            except Exception as e:
+                failed.append((idx, e))
+                continue
+            if step == "chain_of_thought" and is_no_op(previous_summary, summary):
+                # Keep the summary the model left alone, so small rewordings
+                # do not drift through the rest of the chain.
+                no_ops += 1
+                continue
+            no_ops = 0
+            previous_summary = summary
+        get_tracer().emit(
+            "cot_calls",
+            sections=len(paper["document"]),
+            calls=calls,
+            calls_saved=len(paper["document"]) - calls,
+        )
+    if failed and not previous_summary:
+        raise failed[0][1]
+
+    result_dict = {}
+
+    result_dict["title"] = paper["title"]
+    result_dict["gt_summary"] = paper["summary"]
+    result_dict["id"] = paper["id"]
+    result_dict["extraction_type"] = "chain_of_thought"
+    result_dict["pred_summary"] = previous_summary
+    result_dict["calls_saved"] = len(paper["document"]) - calls
+    if failed:
+        result_dict["failed_sections"] = [
+            describe(error, section=idx) for idx, error in failed
+        ]
+
+    return result_dict
+
+
+async def tree_summarization_task(client, paper, skip_boilerplate=False):
+    sections = select_sections(paper, skip_boilerplate)
+    failed = []
+
+    async def summarize(section, text, summary, step, **fields):
+        try:
+            return await traced(
+                client.post(generate_payload(text, summary, step, client.backend)),
+                step=step,
+                section=section,
+                **fields,
+            )
+        except Exception as e:
+            failed.append((section, e))
+            return None
+
+    async def refine(left, right, level):
+        # Each side is (index in paper["document"] of its first section,
+        # text); a failed call is reported against the right side, whose
+        # content is what gets lost.
+        (idx, summary), (section, context) = left, right
+        if summary is None and level == 0:
+            # The base summary failed, so the raw section text starts afresh.
+            return idx, await summarize(
+                section, context, "", "base_summary", level=level
+            )
+        if summary is None or context is None:
+            return idx, context if summary is None else summary
+        refined = await summarize(
+            section, context, summary, "chain_of_thought", level=level
+        )
+        return idx, summary if refined is None else refined
+
+    with trace_context(paper_id=paper["id"], stage="chain_of_thought-tree"):
+        summaries = list(
+            zip(
+                [idx for idx, _ in sections[::2]],
+                await asyncio.gather(
+                    *[
+                        summarize(idx, doc["text"], "", "base_summary")
+                        for idx, doc in sections[::2]
+                    ]
                 ),
-                headers={"Content-Type": "application/json"},
-            ).text
+            )
+        )
+        # The first level refines with the raw text of the following section,
+        # as the linear chain does; above it each summary is refined with its
+        # right neighbour, so section order is kept and depth is log2(sections).
+        # A failed refine keeps the left summary, so failures lose one
+        # section's context rather than the paper.
+        contexts = [(idx, doc["text"]) for idx, doc in sections[1::2]]
+        level = 0
+        while contexts:
+            refined = await asyncio.gather(
+                *[
+                    refine(left, right, level)
+                    for left, right in zip(summaries, contexts)
+                ]
+            )
+            if len(summaries) > len(contexts):
+                refined.append(summaries[-1])
+            summaries, contexts = refined[::2], refined[1::2]
+            level += 1
+        summaries = [summary for _, summary in summaries]
+        calls = tree_calls(len(sections))
+        get_tracer().emit(
+            "cot_calls",
+            sections=len(paper["document"]),
+            calls=calls,
+            calls_saved=tree_calls(len(paper["document"])) - calls,
+        )
+    if summaries[0] is None:
+        raise min(failed, key=lambda failure: failure[0])[1]
+
+    result_dict = {}
 
-    time.sleep(1)
+    result_dict["title"] = paper["title"]
+    result_dict["gt_summary"] = paper["summary"]
+    result_dict["id"] = paper["id"]
+    result_dict["extraction_type"] = "chain_of_thought"
+    result_dict["pred_summary"] = summaries[0]
+    result_dict["calls_saved"] = tree_calls(len(paper["document"])) - calls
+    if failed:
+        result_dict["failed_sections"] = [
+            describe(error, section=idx)
+            for idx, error in sorted(failed, key=lambda failure: failure[0])
+        ]
+
+    return result_dict
+
+
+TASKS = {"linear": summarization_task, "tree": tree_summarization_task}
+
+
+async def summarize_corpus(
+    papers,
+    on_result,
+    completed=(),
+    max_papers=256,
+    mode="linear",
+    min_novelty=MIN_NOVELTY,
+    patience=PATIENCE,
+    skip_boilerplate=False,
+    dead_letters=None,
+    **client_options,
+):
+    task = TASKS[mode]
+    dead_letters = dead_letters or DeadLetters()
+    options = {"skip_boilerplate": skip_boilerplate}
+    if mode == "linear":
+        options.update(min_novelty=min_novelty, patience=patience)
+    saved = []
+
+    async def run(paper):
+        unit = {"paper_id": paper["id"], "configuration": "chain_of_thought-none"}
+        try:
+            result_dict = await task(client, paper, **options)
+        except Exception as e:
+            dead_letters.record("summarize", [describe(e)], mode=mode, **unit)
+            return
+        if result_dict is not None:
+            saved.append(result_dict["calls_saved"])
+            on_result(result_dict)
+            if "failed_sections" in result_dict:
+                dead_letters.record(
+                    "summarize",
+                    result_dict["failed_sections"],
+                    partial=True,
+                    mode=mode,
+                    **unit,
+                )
+
+    jobs = (paper for paper in papers if paper["id"] not in completed)
+    async with ChatClient(**client_options) as client:
+        with tqdm(total=len(papers) - len(completed)) as progress:
+            await run_bounded(jobs, run, max_papers, progress.update)
+        print(f"Client: {client.report()}")
+    if saved:
+        print(
+            f"Saved {sum(saved)} calls over {len(saved)} papers "
+            f"(max {max(saved)} in one paper)"
+        )
+    if dead_letters.count:
+        print(f"Dead letters: {dead_letters.count}")
 
 
 if __name__ == "__main__":
-    with open("papers.json", "r", encoding="utf-16") as file:
-        papers = json.load(file)
-        cot_generated_summaries = []
-        with Pool(8) as pool:
-            result = pool.map_async(summarization_task, papers)
-            for result in result.get():
-                cot_generated_summaries.append(result)
-        with open("cot_summaries.json", "w", encoding="utf-16") as file:
-            json.dump(cot_generated_summaries, file, indent=4)
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    add_prompt_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_failure_arguments(parser)
+    parser.add_argument("--corpus", default="papers.json")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--max-papers", type=int, default=256)
+    parser.add_argument("--mode", choices=sorted(TASKS), default="linear")
+    parser.add_argument("--refresh", default=None)
+    parser.add_argument("--min-novelty", type=float, default=MIN_NOVELTY)
+    parser.add_argument("--patience", type=int, default=PATIENCE)
+    parser.add_argument("--skip-boilerplate", action="store_true")
+    args = parser.parse_args()
+    if args.refresh is not None:
+        # A refresh re-summarizes only the changed papers, so it always builds
+        # on the existing output.
+        args.resume = True
+    if args.prompts is not None:
+        load_prompts(args.prompts)
+    output = "cot_summaries" if args.mode == "linear" else f"cot_{args.mode}_summaries"
+
+    papers = load_corpus(args.corpus)
+    changed = set() if args.refresh is None else load_changed_ids(args.refresh)
+    dead_letters = DeadLetters(args.dead_letters)
+    if args.retry_dead_letters:
+        # Replay only the dead-lettered papers on top of the existing output.
+        retried = {
+            entry["paper_id"]
+            for entry in dead_letters.take(
+                lambda entry: entry["stage"] == "summarize"
+                and entry["configuration"] == "chain_of_thought-none"
+                and entry.get("mode", "linear") == args.mode
+            )
+        }
+
+    if not (args.resume or args.retry_dead_letters) and os.path.exists(
+        f"{output}.jsonl"
+    ):
+        os.remove(f"{output}.jsonl")
+    checkpoint = Checkpoint(f"{output}.jsonl")
+    with instrumented(args):
+        async_to_sync(summarize_corpus)(
+            papers,
+            checkpoint.append,
+            completed=(
+                set(papers.ids()) - retried
+                if args.retry_dead_letters
+                else checkpoint.completed_ids() - changed
+            ),
+            max_papers=args.max_papers,
+            mode=args.mode,
+            min_novelty=args.min_novelty,
+            patience=args.patience,
+            skip_boilerplate=args.skip_boilerplate,
+            dead_letters=dead_letters,
+            **client_options(args),
+        )
+    dead_letters.close()
+    checkpoint.export(f"{output}.json", papers.ids())
+    checkpoint.close()
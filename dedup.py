@@ -0,0 +1,279 @@
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+
+import numpy as np
+
+from corpus import load_corpus
+
+WHITESPACE = re.compile(r"\s+")
+SHINGLE_SIZE = 3
+PERMUTATIONS = 64
+ROWS = 4
+BANDS = PERMUTATIONS // ROWS
+MIN_SHINGLES = 8
+MIN_CONTAINED_LENGTH = 200
+# A fixed seed keeps signatures comparable across runs and index refreshes.
+MULTIPLIERS, INCREMENTS = np.random.default_rng(23).integers(
+    1, 2**63, (2, PERMUTATIONS), dtype=np.uint64
+)
+MULTIPLIERS |= np.uint64(1)
+
+
+def normalize(text):
+    return WHITESPACE.sub(" ", (text or "").lower()).strip()
+
+
+def content_hash(text):
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+
+def shingles(text):
+    words = normalize(text).split()
+    return [
+        " ".join(words[idx : idx + SHINGLE_SIZE])
+        for idx in range(len(words) - SHINGLE_SIZE + 1)
+    ]
+
+
+def minhash(text):
+    grams = shingles(text)
+    if len(grams) < MIN_SHINGLES:
+        return None
+    hashes = np.frombuffer(
+        b"".join(
+            hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+            for gram in grams
+        ),
+        dtype="<u8",
+    )
+    with np.errstate(over="ignore"):
+        return (hashes[:, None] * MULTIPLIERS + INCREMENTS).min(axis=0)
+
+
+def similarity(first, second):
+    return float((first == second).mean())
+
+
+def band_keys(signature):
+    return [
+        f"{band}:{signature[band * ROWS : (band + 1) * ROWS].tobytes().hex()}"
+        for band in range(BANDS)
+    ]
+
+
+def dedupe_indices(sections, threshold=0.8):
+    texts = [normalize(section["text"]) for section in sections]
+    hashes = [content_hash(text) for text in texts]
+    signatures = [minhash(text) for text in texts]
+    kept = []
+    dropped = []
+    for idx, text in enumerate(texts):
+        reason = None
+        for other in kept:
+            if hashes[other] == hashes[idx]:
+                reason = "exact"
+            elif (
+                signatures[idx] is not None
+                and signatures[other] is not None
+                and similarity(signatures[idx], signatures[other]) >= threshold
+            ):
+                reason = "near"
+            if reason is not None:
+                break
+        if reason is None and len(text) >= MIN_CONTAINED_LENGTH:
+            # Nested parsing repeats a subsection's text inside its parent;
+            # the parent already carries it.
+            if any(
+                len(texts[other]) > len(text) and text in texts[other]
+                for other in range(len(texts))
+            ):
+                reason = "contained"
+        if reason is None:
+            kept.append(idx)
+        else:
+            dropped.append((idx, reason))
+    return kept, dropped
+
+
+def dedupe_sections(sections, threshold=0.8):
+    kept, dropped = dedupe_indices(sections, threshold)
+    return [sections[idx] for idx in kept], dropped
+
+
+class SectionIndex:
+    def __init__(self, path="sections.sqlite", threshold=0.8):
+        self.path = path
+        self.threshold = threshold
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            "id TEXT PRIMARY KEY, url TEXT, content_hash TEXT NOT NULL, "
+            "sections TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sections ("
+            "hash TEXT PRIMARY KEY, signature BLOB, paper_id TEXT NOT NULL, "
+            "section_idx INTEGER NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS bands (key TEXT NOT NULL, hash TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key)")
+        self.connection.commit()
+
+    def near_duplicate(self, signature, paper_id):
+        # Locality-sensitive hashing: sections sharing any band of ROWS
+        # signature values are candidates, then similarity decides.
+        keys = band_keys(signature)
+        rows = self.connection.execute(
+            "SELECT DISTINCT sections.signature, sections.paper_id, "
+            "sections.section_idx FROM bands JOIN sections "
+            "ON sections.hash = bands.hash WHERE sections.paper_id != ? "
+            f"AND bands.key IN ({', '.join('?' * len(keys))})",
+            (paper_id, *keys),
+        ).fetchall()
+        for other, other_paper, section_idx in rows:
+            if similarity(signature, np.frombuffer(other, dtype="<u8")) >= (
+                self.threshold
+            ):
+                return other_paper, section_idx
+        return None
+
+    def update(self, paper):
+        hashes = [content_hash(section["text"]) for section in paper["document"]]
+        paper_hash = content_hash(
+            "\n".join([paper["title"], paper["summary"], *hashes])
+        )
+        row = self.connection.execute(
+            "SELECT content_hash, sections FROM papers WHERE id = ?", (paper["id"],)
+        ).fetchone()
+        previous = set() if row is None else set(json.loads(row[1]))
+        if row is None:
+            status = "new"
+        elif row[0] == paper_hash:
+            status = "unchanged"
+        else:
+            status = "changed"
+
+        # Sections the paper no longer has are dropped with their bands, so
+        # they stop matching other papers as duplicates, unless another paper
+        # still has the same text, which then takes the row over.
+        current = set(hashes)
+        for (section_hash,) in self.connection.execute(
+            "SELECT hash FROM sections WHERE paper_id = ?", (paper["id"],)
+        ).fetchall():
+            if section_hash in current:
+                continue
+            owner = self.connection.execute(
+                "SELECT id, sections FROM papers WHERE id != ? AND sections LIKE ?",
+                (paper["id"], f'%"{section_hash}"%'),
+            ).fetchone()
+            if owner is None:
+                self.connection.execute(
+                    "DELETE FROM bands WHERE hash = ?", (section_hash,)
+                )
+                self.connection.execute(
+                    "DELETE FROM sections WHERE hash = ?", (section_hash,)
+                )
+            else:
+                self.connection.execute(
+                    "UPDATE sections SET paper_id = ?, section_idx = ? WHERE hash = ?",
+                    (owner[0], json.loads(owner[1]).index(section_hash), section_hash),
+                )
+
+        changed_sections = []
+        shared_sections = {}
+        for idx, (section, section_hash) in enumerate(zip(paper["document"], hashes)):
+            if section_hash in previous:
+                continue
+            changed_sections.append(idx)
+            existing = self.connection.execute(
+                "SELECT paper_id, section_idx FROM sections WHERE hash = ?",
+                (section_hash,),
+            ).fetchone()
+            signature = minhash(section["text"])
+            if existing is not None and existing[0] != paper["id"]:
+                shared_sections[idx] = {"match": "exact", "paper_id": existing[0]}
+            elif signature is not None:
+                near = self.near_duplicate(signature, paper["id"])
+                if near is not None:
+                    shared_sections[idx] = {"match": "near", "paper_id": near[0]}
+            if existing is None:
+                self.connection.execute(
+                    "INSERT INTO sections VALUES (?, ?, ?, ?)",
+                    (
+                        section_hash,
+                        (
+                            None
+                            if signature is None
+                            else signature.astype("<u8").tobytes()
+                        ),
+                        paper["id"],
+                        idx,
+                    ),
+                )
+                if signature is not None:
+                    self.connection.executemany(
+                        "INSERT INTO bands VALUES (?, ?)",
+                        [(key, section_hash) for key in band_keys(signature)],
+                    )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?)",
+            (paper["id"], paper.get("url"), paper_hash, json.dumps(hashes)),
+        )
+        self.connection.commit()
+        return {
+            "id": paper["id"],
+            "status": status,
+            "changed_sections": changed_sections,
+            "shared_sections": shared_sections,
+        }
+
+    def close(self):
+        self.connection.close()
+
+
+def refresh_report(results):
+    report = {"new": [], "changed": [], "unchanged": []}
+    for result in results:
+        report[result["status"]].append(result["id"])
+    report["sections"] = {
+        result["id"]: {
+            "changed": result["changed_sections"],
+            "shared": result["shared_sections"],
+        }
+        for result in results
+        if result["changed_sections"]
+    }
+    return report
+
+
+def load_changed_ids(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return set(json.load(file)["changed"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default="papers.json")
+    parser.add_argument("--index", default="sections.sqlite")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    index = SectionIndex(args.index, args.threshold)
+    duplicates = 0
+    results = []
+    for paper in load_corpus(args.corpus):
+        _, dropped = dedupe_sections(paper["document"], args.threshold)
+        duplicates += len(dropped)
+        results.append(index.update(paper))
+    index.close()
+    report = refresh_report(results)
+    print(
+        f"{len(report['new'])} new, {len(report['changed'])} changed, "
+        f"{len(report['unchanged'])} unchanged papers; "
+        f"{duplicates} duplicate sections within papers"
+    )
@@ -0,0 +1,164 @@
+import argparse
+import re
+import sqlite3
+
+import numpy as np
+
+LABELLED_SCORE = re.compile(
+    r"score\s*(?:of|is|:|=)?\s*\**\s*(\d+(?:\.\d+)?)\s*(%|/\s*(?:100|10|1)(?:\.0+)?)?",
+    re.IGNORECASE,
+)
+# Only a response that is the number alone; a number elsewhere in free text
+# is as likely to be a count or a section number as a score.
+BARE_SCORE = re.compile(
+    r"[\s*\"'`]*(\d+(?:\.\d+)?)\s*(%|/\s*(?:100|10|1)(?:\.0+)?)?[\s*\"'`.]*"
+)
+BOOTSTRAP_CELLS = 1 << 22
+
+
+def normalise_score(value, scale):
+    value = float(value)
+    if scale:
+        scale = scale.replace("/", "").strip()
+        value /= 100 if scale == "%" else float(scale)
+    return value if 0 <= value <= 1 else None
+
+
+def parse_score(text):
+    if not text:
+        return None
+    for value, scale in LABELLED_SCORE.findall(text):
+        score = normalise_score(value, scale)
+        if score is not None:
+            return score
+    match = BARE_SCORE.fullmatch(text)
+    return None if match is None else normalise_score(*match.groups())
+
+
+def bootstrap_means(values, resamples, rng):
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.full(resamples, np.nan)
+    # Resample in chunks so memory stays bounded for large inputs.
+    chunk = max(1, BOOTSTRAP_CELLS // len(values))
+    means = np.empty(resamples)
+    for start in range(0, resamples, chunk):
+        size = min(chunk, resamples - start)
+        indices = rng.integers(0, len(values), (size, len(values)))
+        means[start : start + size] = values[indices].mean(axis=1)
+    return means
+
+
+def aggregate(matrix, labels, resamples=10000, confidence=0.95, seed=0):
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2 * 100
+    summary = {}
+    for idx, label in enumerate(labels):
+        values = matrix[:, idx]
+        present = values[~np.isnan(values)]
+        means = bootstrap_means(values, resamples, rng)
+        summary[label] = {
+            "n": len(present),
+            "mean": float(present.mean()) if len(present) else None,
+            "std": float(present.std(ddof=1)) if len(present) > 1 else None,
+            "ci": (
+                [float(v) for v in np.nanpercentile(means, [tail, 100 - tail])]
+                if len(present)
+                else None
+            ),
+        }
+
+    differences = {}
+    for first in range(len(labels)):
+        for second in range(first + 1, len(labels)):
+            paired = matrix[:, first] - matrix[:, second]
+            present = paired[~np.isnan(paired)]
+            if len(present) == 0:
+                continue
+            means = bootstrap_means(paired, resamples, rng)
+            differences[f"{labels[first]} - {labels[second]}"] = {
+                "n": len(present),
+                "mean": float(present.mean()),
+                "ci": [float(v) for v in np.percentile(means, [tail, 100 - tail])],
+                "p_not_better": float((means <= 0).mean()),
+            }
+    return summary, differences
+
+
+class EvaluationStore:
+    def __init__(self, path="evaluations.sqlite"):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "paper_id TEXT NOT NULL, method TEXT NOT NULL, summary_type TEXT NOT NULL, "
+            "judge TEXT NOT NULL, score REAL, response TEXT, "
+            "PRIMARY KEY (paper_id, method, summary_type, judge))"
+        )
+        self.connection.commit()
+
+    def record(self, paper_id, method, summary_type, response, judge="llm", score=None):
+        if score is None:
+            score = parse_score(response)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+            (paper_id, method, summary_type, judge, score, response),
+        )
+        self.connection.commit()
+        return score
+
+    def record_many(self, rows, judge="llm"):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (paper_id, method, summary_type, judge, score, response)
+                for paper_id, method, summary_type, score, response in rows
+            ],
+        )
+        self.connection.commit()
+
+    def unparsed(self, judge="llm"):
+        return self.connection.execute(
+            "SELECT paper_id, method, summary_type, response FROM scores "
+            "WHERE judge = ? AND score IS NULL",
+            (judge,),
+        ).fetchall()
+
+    def matrix(self, judge="llm"):
+        rows = self.connection.execute(
+            "SELECT paper_id, method || '-' || summary_type, score FROM scores "
+            "WHERE judge = ? AND score IS NOT NULL",
+            (judge,),
+        ).fetchall()
+        paper_ids = sorted({row[0] for row in rows})
+        labels = sorted({row[1] for row in rows})
+        positions = {paper_id: idx for idx, paper_id in enumerate(paper_ids)}
+        columns = {label: idx for idx, label in enumerate(labels)}
+        matrix = np.full((len(paper_ids), len(labels)), np.nan)
+        if rows:
+            matrix[
+                [positions[row[0]] for row in rows], [columns[row[1]] for row in rows]
+            ] = [row[2] for row in rows]
+        return paper_ids, labels, matrix
+
+    def summary(self, judge="llm", **options):
+        _, labels, matrix = self.matrix(judge)
+        return aggregate(matrix, labels, **options)
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default="evaluations.sqlite")
+    parser.add_argument("--judge", default="llm")
+    args = parser.parse_args()
+
+    store = EvaluationStore(args.store)
+    summary, differences = store.summary(args.judge)
+    for label, stats in summary.items():
+        print(label, stats)
+    for label, stats in differences.items():
+        print(label, stats)
+    print(f"{len(store.unparsed(args.judge))} response(s) without a parsable score")
@@ -1,87 +1,296 @@
+import argparse
 import asyncio
+import re
 
-import aiohttp
-from aiohttp_retry import ExponentialRetry, RetryClient
 from asgiref.sync import async_to_sync
 
+from backends import DEFAULT_BACKEND
+from client import ChatClient, add_client_arguments, client_options
+from eval_store import EvaluationStore, parse_score
+from failures import DeadLetters, add_failure_arguments, describe, settle
+from instrumentation import (
+    add_instrumentation_arguments,
+    instrumented,
+    trace_context,
+    traced,
+)
+from prompts import add_prompt_arguments, get_template, load_prompts, register
+
 import json
 
 from tqdm import tqdm
 
+register(
+    "evaluate",
+    """Your job is to generate a score between two summaries based on their quality and similarity in meaning.\n\nWe have provided a ground_truth summary of a research paper: {gt_text}\nWe have the opportunity to evaluate a predicted summary as provided below.\n------------\n{pred_text}\n------------\nGiven the ground_truth summary, evaluate and score the predicted summary on a scale of 0.00 to 1.00\nIf the ground_truth summary and predicted summary are exactly the same give them a score of 1.00 but if they are completely different give them a score of 0.00""",
+    temperature=0.1,
+    max_length=24000,
+)
+
+
+def generate_payload(gt_text, pred_text, backend=DEFAULT_BACKEND):
+    return get_template("evaluate").payload(
+        backend, gt_text=gt_text, pred_text=pred_text
+    )
 
-def generate_payload(gt_text, pred_text):
-    prompt_text = f"""Your job is to generate a score between two summaries based on their quality and similarity in meaning.\n\nWe have provided a ground_truth summary of a research paper: {gt_text}\nWe have the opportunity to evaluate a predicted summary as provided below.\n------------\n{pred_text}\n------------\nGiven the ground_truth summary, evaluate and score the predicted summary on a scale of 0.00 to 1.00\nIf the ground_truth summary and predicted summary are exactly the same give them a score of 1.00 but if they are completely different give them a score of 0.00"""
-
-    return {
-        "model": {
-            "id": "openchat_v3.2_mistral",
-            "name": "OpenChat Aura",
-            "maxLength": 24000,
-            "tokenLimit": 8192,
-        },
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt_text,
-            }
-        ],
-        "key": "",
-        "prompt": " ",
-        "temperature": 0.1,
-    }
 
+BATCH_LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
 
-async def generate_summary(url, payload, response_list, request_index):
-    retry_options = ExponentialRetry(
-        attempts=5, statuses=[500], exceptions={aiohttp.ClientConnectorError}
+BATCH_SCORE = re.compile(
+    r"^[\s*#>-]*(?:summary|candidate)?\s*\(?([A-Z])\)?\**\s*[:=\-]\s*\**\s*(\d(?:\.\d+)?)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+register(
+    "evaluate-batch",
+    """Your job is to generate scores between a ground_truth summary and several predicted summaries based on their quality and similarity in meaning.\n\nWe have provided a ground_truth summary of a research paper: {gt_text}\nWe have the opportunity to evaluate the predicted summaries provided below, each one independently of the others.\n------------\n{candidates}Given the ground_truth summary, evaluate and score each predicted summary on a scale of 0.00 to 1.00\nIf the ground_truth summary and a predicted summary are exactly the same give it a score of 1.00 but if they are completely different give it a score of 0.00\nAnswer with exactly one line per predicted summary and nothing else, in this format:\n{score_lines}""",
+    temperature=0.1,
+    max_length=24000,
+)
+
+
+def generate_batch_payload(gt_text, pred_texts, backend=DEFAULT_BACKEND):
+    candidates = "".join(
+        f"Summary {label}:\n{pred_text}\n------------\n"
+        for label, pred_text in zip(BATCH_LABELS, pred_texts)
+    )
+    score_lines = "\n".join(
+        f"{label}: <score>" for label in BATCH_LABELS[: len(pred_texts)]
     )
-    async with RetryClient(
-        retry_options=retry_options, raise_for_status=False
-    ) as client:
-        async with client.post(
-            url,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        ) as response:
-            if response.status == 200:
-                try:
-                    response_list[request_index] = await response.text()
-                except Exception as e:
-                    print(e)
-            else:
-                print(response.status)
+    return get_template("evaluate-batch").payload(
+        backend, gt_text=gt_text, candidates=candidates, score_lines=score_lines
+    )
+
+
+def parse_batch_scores(text, count):
+    scores = [None] * count
+    for label, score in BATCH_SCORE.findall(text or ""):
+        idx = BATCH_LABELS.find(label.upper())
+        if idx < count and scores[idx] is None and float(score) <= 1:
+            scores[idx] = score
+    return scores
+
+
+def batch_candidates(gt_text, pred_texts, max_length, backend=DEFAULT_BACKEND):
+    batches = [[]]
+    for idx, pred_text in enumerate(pred_texts):
+        batch = batches[-1] + [idx]
+        prompt = generate_batch_payload(
+            gt_text, [pred_texts[i] for i in batch], backend
+        )
+        if len(batches[-1]) > 0 and (
+            len(batch) > len(BATCH_LABELS)
+            or len(prompt["messages"][0]["content"]) > max_length
+        ):
+            batches.append([idx])
+        else:
+            batches[-1] = batch
+    return batches
+
+
+async def generate_summary(client, payload, response_list, request_index):
+    response_list[request_index] = await client.post(payload)
 
 
 @async_to_sync
-async def get_summary_evals(papers):
+async def get_summary_evals(
+    papers, dead_letters=None, configuration=None, **client_options
+):
     evaluate_summaries = [None] * len(papers)
-    tasks = [
-        asyncio.ensure_future(
-            generate_summary(
-                "https://openchat.team/api/chat",
-                generate_payload(paper["gt_summary"], paper["pred_summary"]),
-                evaluate_summaries,
-                idx,
+    dead_letters = dead_letters or DeadLetters()
+    async with ChatClient(**client_options) as client:
+        tasks = [
+            asyncio.ensure_future(
+                traced(
+                    generate_summary(
+                        client,
+                        generate_payload(
+                            paper["gt_summary"], paper["pred_summary"], client.backend
+                        ),
+                        evaluate_summaries,
+                        idx,
+                    ),
+                    stage="evaluate",
+                    paper_id=paper.get("id"),
+                )
             )
-        )
-        for idx, paper in enumerate(papers)
-    ]
+            for idx, paper in enumerate(papers)
+        ]
 
-    await asyncio.gather(*tasks)
+        # A failed judgement leaves its response as None for the others.
+        for paper, result in zip(papers, await settle(tasks)):
+            if isinstance(result, Exception):
+                dead_letters.record(
+                    "evaluate",
+                    [describe(result)],
+                    paper_id=paper.get("id"),
+                    configuration=configuration,
+                )
+        print(f"Client: {client.report()}")
     return evaluate_summaries
 
 
-for method, summary_type in [
-    ("few_shot", "extractive"),
-    ("zero_shot", "extractive"),
-    ("few_shot", "abstractive"),
-    ("zero_shot", "abstractive"),
-    ("chain_of_thought", "none"),
-]:
-    with open(
-        f"{method}_generated_summaries_{summary_type}.json", "r", encoding="utf-16"
-    ) as file:
-        papers = json.load(file)
-
-    evaluated_summaries = get_summary_evals(papers)
-    print(f"'{method}-{summary_type}': {evaluated_summaries}")
+async def evaluate_paper_batch(client, gt_text, pred_texts):
+    # Each candidate gets a (score, raw response) judgement, whether it was
+    # scored in a batch or by the single fallback.
+    max_length = get_template("evaluate-batch").max_length
+    judgements = [None] * len(pred_texts)
+    for batch in batch_candidates(gt_text, pred_texts, max_length, client.backend):
+        try:
+            response = await traced(
+                client.post(
+                    generate_batch_payload(
+                        gt_text, [pred_texts[idx] for idx in batch], client.backend
+                    )
+                ),
+                step="batch",
+            )
+        except Exception:
+            # The single fallback below retries each candidate on its own.
+            response = None
+        for idx, score in zip(batch, parse_batch_scores(response, len(batch))):
+            if score is not None:
+                judgements[idx] = (float(score), response)
+
+    missing = [idx for idx, judgement in enumerate(judgements) if judgement is None]
+    responses = await settle(
+        [
+            traced(
+                client.post(generate_payload(gt_text, pred_texts[idx], client.backend)),
+                step="single",
+            )
+            for idx in missing
+        ]
+    )
+    failures = {}
+    for idx, response in zip(missing, responses):
+        if isinstance(response, Exception):
+            failures[idx] = response
+        else:
+            judgements[idx] = (parse_score(response), response)
+    return judgements, len(missing), failures
+
+
+@async_to_sync
+async def get_batched_summary_evals(results, dead_letters=None, **client_options):
+    dead_letters = dead_letters or DeadLetters()
+    evaluate_summaries = {
+        configuration: [None] * len(papers) for configuration, papers in results.items()
+    }
+    candidates = {}
+    for configuration, papers in results.items():
+        for idx, paper in enumerate(papers):
+            candidates.setdefault(
+                paper["id"], {"gt_summary": paper["gt_summary"], "entries": []}
+            )["entries"].append((configuration, idx, paper["pred_summary"]))
+
+    async def evaluate_paper(paper_id, candidate):
+        with trace_context(stage="evaluate", paper_id=paper_id):
+            judgements, fallbacks, failures = await evaluate_paper_batch(
+                client,
+                candidate["gt_summary"],
+                [pred_text for _, _, pred_text in candidate["entries"]],
+            )
+        for (configuration, idx, _), judgement in zip(candidate["entries"], judgements):
+            evaluate_summaries[configuration][idx] = judgement
+        for position, error in failures.items():
+            dead_letters.record(
+                "evaluate",
+                [describe(error)],
+                paper_id=paper_id,
+                configuration="-".join(candidate["entries"][position][0]),
+            )
+        return fallbacks
+
+    async with ChatClient(**client_options) as client:
+        fallbacks = await asyncio.gather(
+            *[
+                evaluate_paper(paper_id, candidate)
+                for paper_id, candidate in candidates.items()
+            ]
+        )
+        print(f"Fallback single calls: {sum(fallbacks)}")
+        print(f"Client: {client.report()}")
+    return evaluate_summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    add_prompt_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_failure_arguments(parser)
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--store", default="evaluations.sqlite")
+    args = parser.parse_args()
+    if args.prompts is not None:
+        load_prompts(args.prompts)
+    options = client_options(args)
+
+    results = {}
+    for method, summary_type in [
+        ("few_shot", "extractive"),
+        ("zero_shot", "extractive"),
+        ("few_shot", "abstractive"),
+        ("zero_shot", "abstractive"),
+        ("chain_of_thought", "none"),
+    ]:
+        with open(
+            f"{method}_generated_summaries_{summary_type}.json", "r", encoding="utf-16"
+        ) as file:
+            results[(method, summary_type)] = json.load(file)
+
+    dead_letters = DeadLetters(args.dead_letters)
+    if args.retry_dead_letters:
+        # Judge only the dead-lettered summaries; the store keeps the rest.
+        retried = {
+            (entry["configuration"], entry["paper_id"])
+            for entry in dead_letters.take(lambda entry: entry["stage"] == "evaluate")
+        }
+        results = {
+            configuration: [
+                paper
+                for paper in papers
+                if ("-".join(configuration), paper["id"]) in retried
+            ]
+            for configuration, papers in results.items()
+        }
+
+    with instrumented(args):
+        if args.batch:
+            evaluated = get_batched_summary_evals(
+                results, dead_letters=dead_letters, **options
+            )
+        else:
+            evaluated = {
+                configuration: [
+                    None if response is None else (parse_score(response), response)
+                    for response in get_summary_evals(
+                        papers,
+                        dead_letters=dead_letters,
+                        configuration="-".join(configuration),
+                        **options,
+                    )
+                ]
+                for configuration, papers in results.items()
+            }
+    dead_letters.close()
+    store = EvaluationStore(args.store)
+    for (method, summary_type), evaluated_summaries in evaluated.items():
+        store.record_many(
+            [
+                (paper["id"], method, summary_type, *judgement)
+                for paper, judgement in zip(
+                    results[(method, summary_type)], evaluated_summaries
+                )
+                # A failed judgement must not replace a stored score.
+                if judgement is not None
+            ]
+        )
+        print(f"'{method}-{summary_type}': {evaluated_summaries}")
+
+    summary, differences = store.summary()
+    for label, stats in {**summary, **differences}.items():
+        print(label, stats)
+    store.close()
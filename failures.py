@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from instrumentation import get_tracer
+
+RETRYABLE = {"throttled", "server_error", "timeout", "connection_error"}
+
+
+class RequestFailed(Exception):
+    def __init__(self, kind, error, status=None, attempts=1):
+        super().__init__(f"{kind} after {attempts} attempt(s): {error}")
+        self.kind = kind
+        self.status = status
+        self.attempts = attempts
+
+    @property
+    def retryable(self):
+        return self.kind in RETRYABLE
+
+
+def classify(error):
+    if isinstance(error, RequestFailed):
+        return error.kind
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(
+        error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, OSError)
+    ):
+        return "connection_error"
+    return "error"
+
+
+def describe(error, **fields):
+    return {**fields, "kind": classify(error), "error": str(error) or repr(error)}
+
+
+async def settle(awaitables):
+    # Like gather, but one failed request does not discard the others.
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            raise result
+    return results
+
+
+class DeadLetters:
+    def __init__(self, path=None):
+        self.path = path
+        self.file = None if path is None else open(path, "a", encoding="utf-8")
+        self.count = 0
+
+    def record(self, stage, failures, **unit):
+        entry = {"stage": stage, **unit, "failures": failures}
+        self.count += 1
+        if self.file is not None:
+            self.file.write(json.dumps({**entry, "time": time.time()}) + "\n")
+            self.file.flush()
+        get_tracer().emit(
+            "dead_letter",
+            **entry,
+            kind=failures[0]["kind"] if failures else None,
+            error="; ".join(failure["error"] for failure in failures),
+        )
+
+    def take(self, predicate):
+        # Removes the matching entries so a replay only writes back the units
+        # that fail again; entries for other stages stay in the file.
+        if self.file is None:
+            return []
+        self.file.close()
+        with open(self.path, "r", encoding="utf-8") as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        taken = [entry for entry in entries if predicate(entry)]
+        with open(self.path, "w", encoding="utf-8") as file:
+            for entry in entries:
+                if not predicate(entry):
+                    file.write(json.dumps(entry) + "\n")
+        self.file = open(self.path, "a", encoding="utf-8")
+        return taken
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def add_failure_arguments(parser, retry=True):
+    parser.add_argument("--dead-letters", default="dead_letters.jsonl")
+    if retry:
+        parser.add_argument("--retry-dead-letters", action="store_true")
@@ -0,0 +1,191 @@
+import contextlib
+import contextvars
+import cProfile
+import json
+import pstats
+import time
+
+FIELDS = contextvars.ContextVar("trace_fields", default={})
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def trace_fields():
+    return FIELDS.get()
+
+
+@contextlib.contextmanager
+def trace_context(**fields):
+    token = FIELDS.set({**FIELDS.get(), **fields})
+    try:
+        yield
+    finally:
+        FIELDS.reset(token)
+
+
+async def traced(awaitable, **fields):
+    with trace_context(**fields):
+        return await awaitable
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets, total = self.histograms.get(key, ([0] * len(LATENCY_BUCKETS), 0.0))
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                buckets[idx] += 1
+        self.histograms[key] = (buckets, total + value)
+        self.increment(f"{name}_count", **labels)
+
+    def record(self, event):
+        if event["event"] == "llm_call":
+            labels = {"stage": event.get("stage", "unknown")}
+            self.increment("llm_calls_total", status=str(event["status"]), **labels)
+            self.increment("llm_sent_bytes_total", event["sent_bytes"], **labels)
+            self.increment("llm_received_bytes_total", event["bytes"], **labels)
+            self.increment("llm_input_tokens_total", event["input_tokens"], **labels)
+            self.increment("llm_output_tokens_total", event["output_tokens"], **labels)
+            if event["retry_reason"]:
+                self.increment("llm_retries_total", reason=event["retry_reason"])
+            if event["latency"] is not None:
+                self.observe("llm_latency_seconds", event["latency"], **labels)
+        elif event["event"] == "llm_cache":
+            self.increment("llm_cache_total", hit=str(event["hit"]).lower())
+        elif event["event"] == "cot_calls":
+            self.increment("cot_calls_total", event["calls"])
+            self.increment("cot_calls_saved_total", event["calls_saved"])
+        elif event["event"] == "dead_letter":
+            self.increment(
+                "dead_letters_total", stage=event["stage"], kind=str(event["kind"])
+            )
+        elif event["event"] == "fetch":
+            self.increment("fetch_total", status=str(event["status"]))
+            self.increment("fetch_bytes_total", event["bytes"])
+            self.observe("fetch_latency_seconds", event["latency"])
+
+    def render(self):
+        lines = []
+
+        def format_labels(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+        for (name, labels), value in sorted(self.counters.items()):
+            if not name.endswith("_count"):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (buckets, total) in sorted(self.histograms.items()):
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                bucket_labels = (*labels, ("le", str(bound)))
+                lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+            count = self.counters[(f"{name}_count", labels)]
+            lines.append(
+                f'{name}_bucket{format_labels((*labels, ("le", "+Inf")))} {count}'
+            )
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+
+
+class Tracer:
+    def __init__(self, path=None, metrics=None):
+        self.file = None if path is None else open(path, "a", encoding="utf-8")
+        self.metrics = metrics
+
+    def emit(self, event, **fields):
+        record = {"event": event, "time": time.time(), **FIELDS.get(), **fields}
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+        if self.metrics is not None:
+            self.metrics.record(record)
+        if record.get("error"):
+            context = ", ".join(
+                f"{key}={record[key]}"
+                for key in ("stage", "paper_id", "section", "url", "attempt", "status")
+                if record.get(key) is not None
+            )
+            print(f"{event} failed ({context}): {record['error']}")
+        return record
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+TRACER = Tracer()
+
+
+def get_tracer():
+    return TRACER
+
+
+def set_tracer(tracer):
+    global TRACER
+    TRACER = tracer
+
+
+@contextlib.contextmanager
+def profiled(path):
+    if path is None:
+        yield
+        return
+    if path.endswith(".html"):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed; falling back to cProfile")
+            path = f"{path[:-5]}.prof"
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(profiler.output_html())
+            return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
+
+def add_instrumentation_arguments(parser):
+    parser.add_argument("--trace", default=None)
+    parser.add_argument("--metrics", default=None)
+    parser.add_argument("--profile", default=None)
+
+
+@contextlib.contextmanager
+def instrumented(args):
+    metrics = None if args.metrics is None else Metrics()
+    tracer = Tracer(args.trace, metrics)
+    previous = get_tracer()
+    set_tracer(tracer)
+    try:
+        with profiled(args.profile):
+            yield tracer
+    finally:
+        set_tracer(previous)
+        tracer.close()
+        if metrics is not None:
+            metrics.dump(args.metrics)
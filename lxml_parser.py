@@ -0,0 +1,235 @@
+import os
+import re
+import sys
+import unicodedata
+
+import lxml.etree
+import lxml.html
+
+import scrap_for_paper
+
+SECTION_HEADINGS = {
+    "ltx_section": "h2",
+    "ltx_subsection": "h3",
+    "ltx_subsubsection": "h4",
+    "ltx_paragraph": "h4",
+}
+
+
+def class_xpath(tag, name):
+    return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+
+
+def find_next(element, tag, name):
+    match = class_xpath(tag, name)
+    matches = element.xpath(f"(descendant::{match} | following::{match})[1]")
+    return matches[0] if matches else None
+
+
+def classes(element):
+    return (element.get("class") or "").split()
+
+
+def children(element):
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield child
+        if child.tail:
+            yield child.tail
+
+
+def convert_math_to_latex_string(child):
+    if child.tag == "math":
+        return unicodedata.normalize("NFKD", child.get("alttext", ""))
+    elif child.tag in ("span", "a", "cite"):
+        if classes(child) == ["ltx_note", "ltx_role_footnote"]:
+            footnote = "".join(
+                [
+                    unicodedata.normalize("NFKD", sub_child)
+                    if isinstance(sub_child, str)
+                    else convert_math_to_latex_string(sub_child)
+                    for sub_child in children(
+                        find_next(child, "span", "ltx_note_content")
+                    )
+                ][2:]
+            )
+            return f"({footnote})"
+        elif classes(child) == ["ltx_text"]:
+            return "".join(
+                [
+                    unicodedata.normalize("NFKD", sub_child)
+                    if isinstance(sub_child, str)
+                    else convert_math_to_latex_string(sub_child)
+                    for sub_child in children(child)
+                ]
+            )
+        elif classes(child) == ["ltx_equation", "ltx_eqn_table"]:
+            return ""
+        return unicodedata.normalize("NFKD", child.text_content())
+    else:
+        return ""
+
+
+def paragraph_pieces(paras):
+    pieces = []
+    for para in paras:
+        if para.tag == "p":
+            pieces.extend(
+                [
+                    unicodedata.normalize("NFKD", child)
+                    if isinstance(child, str)
+                    else convert_math_to_latex_string(child)
+                    for child in children(para)
+                ]
+            )
+        elif para.tag == "table":
+            math = find_next(para, "math", "ltx_Math")
+            pieces.append("" if math is None else convert_math_to_latex_string(math))
+    return pieces
+
+
+def strip_latex_arguments(text):
+    return re.sub(r"\b([a-zA-Z0-9]+)\s*{[^}]*}", r"\1", text)
+
+
+def parse_heading_text(heading):
+    if heading is None:
+        return ""
+    return re.sub(
+        r"\b([a-zA-Z0-9]+){[^}]*}",
+        r"\1",
+        "".join(
+            [
+                unicodedata.normalize("NFKD", child).strip()
+                if isinstance(child, str)
+                else convert_math_to_latex_string(child)
+                for child in children(heading)
+            ]
+        ),
+    )
+
+
+def section_kinds(element):
+    if element.tag != "section":
+        return []
+    return [name for name in classes(element) if name in SECTION_HEADINGS]
+
+
+def parse_paper(content, url):
+    parsed_paper = {}
+    root = lxml.html.document_fromstring(content)
+    article = root.xpath(f"//{class_xpath('article', 'ltx_document')}")[0]
+
+    # One walk over the article collects, for every section, its heading and
+    # the ltx_para blocks below it, plus the nested sections the html.parser
+    # backend lists after it. A section's text includes its nested sections,
+    # as in that backend, but each block is converted only once.
+    title = abstract = summary = None
+    in_abstract = False
+    sections = []
+    open_sections = []
+    for event, element in lxml.etree.iterwalk(article, events=("start", "end")):
+        if not isinstance(element.tag, str):
+            continue
+        kinds = section_kinds(element)
+        if event == "end":
+            if kinds:
+                del open_sections[-len(kinds) :]
+            if element is abstract:
+                in_abstract = False
+            continue
+
+        if element.tag == "h1" and title is None:
+            title = element
+        elif (
+            element.tag == "div"
+            and abstract is None
+            and "ltx_abstract" in classes(element)
+        ):
+            abstract = element
+            in_abstract = True
+        elif element.tag == "p" and in_abstract and summary is None:
+            summary = element
+        elif element.tag == "div" and "ltx_para" in classes(element):
+            pieces = paragraph_pieces(element)
+            for record in open_sections:
+                record["pieces"].extend(pieces)
+        elif element.tag in ("h2", "h3", "h4"):
+            for record in open_sections:
+                if record["heading"] is None and (
+                    SECTION_HEADINGS[record["kind"]] == element.tag
+                ):
+                    record["heading"] = element
+
+        parents = list(open_sections)
+        for kind in kinds:
+            record = {"kind": kind, "heading": None, "pieces": []}
+            for parent in parents:
+                parent.setdefault(kind, []).append(record)
+            if kind == "ltx_section":
+                sections.append(record)
+            open_sections.append(record)
+
+    parsed_paper["title"] = parse_heading_text(title)
+    parsed_paper["summary"] = parse_heading_text(summary)
+
+    def entry(record):
+        return {
+            "subtitle": parse_heading_text(record["heading"]),
+            "text": strip_latex_arguments(" ".join(record["pieces"])),
+        }
+
+    # The html.parser order: each section, then each subsection followed by
+    # its subsubsections, then the section's ltx_paragraph blocks.
+    document_sections = []
+    for section in sections:
+        document_sections.append(entry(section))
+        for subsection in section.get("ltx_subsection", []):
+            document_sections.append(entry(subsection))
+            for subsubsection in subsection.get("ltx_subsubsection", []):
+                document_sections.append(entry(subsubsection))
+        for paragraph in section.get("ltx_paragraph", []):
+            document_sections.append(entry(paragraph))
+    parsed_paper["document"] = document_sections
+    parsed_paper["url"] = url
+    parsed_paper["id"] = scrap_for_paper.paper_id(url)
+    return parsed_paper
+
+
+def compare_parsers(content, url):
+    expected = scrap_for_paper.parse_paper(content, url)
+    actual = parse_paper(content, url)
+    problems = []
+    for field in ("title", "summary"):
+        if expected[field] != actual[field]:
+            problems.append(f"{field}: {expected[field]!r} != {actual[field]!r}")
+    if len(expected["document"]) != len(actual["document"]):
+        problems.append(
+            f"{len(actual['document'])} sections, "
+            f"expected {len(expected['document'])}"
+        )
+    for idx, (old, new) in enumerate(zip(expected["document"], actual["document"])):
+        for field in ("subtitle", "text"):
+            if old[field] != new[field]:
+                problems.append(
+                    f"section {idx} {field}: {old[field]!r} != {new[field]!r}"
+                )
+    return problems
+
+
+if __name__ == "__main__":
+    cache_dir = sys.argv[1] if len(sys.argv) > 1 else "html_cache"
+    failures = 0
+    for name in sorted(os.listdir(cache_dir)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(cache_dir, name), "rb") as file:
+            content = file.read()
+        problems = compare_parsers(content, name)
+        failures += bool(problems)
+        for problem in problems:
+            print(f"{name}: {problem}")
+    print(f"{failures} page(s) differ")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,279 @@
+import argparse
+import itertools
+import json
+import re
+import time
+
+import numpy as np
+
+TOKEN = re.compile(r"\w+")
+ARTICLES = {"a", "an", "the"}
+HASH_MULTIPLIER = np.uint64(1_000_003)
+DOCUMENT_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def tokenize(text):
+    return TOKEN.findall((text or "").lower())
+
+
+def encode(documents):
+    # Python's string hash stands in for a vocabulary lookup: equal tokens
+    # get equal ids within a run, which is all the metrics need.
+    lengths = np.array([len(tokens) for tokens in documents], dtype=np.int64)
+    ids = np.fromiter(
+        map(hash, itertools.chain.from_iterable(documents)),
+        dtype=np.int64,
+        count=int(lengths.sum()),
+    ).view(np.uint64)
+    return ids, lengths
+
+
+def ngrams(ids, lengths, n):
+    # Rolling hash of every n-gram that does not cross a document boundary,
+    # together with the index of the document it came from.
+    doc = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    valid = position <= np.repeat(lengths, lengths) - n
+    hashes = np.zeros(len(ids), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(n):
+            shifted = np.zeros(len(ids), dtype=np.uint64)
+            shifted[: len(ids) - offset] = ids[offset:]
+            hashes = hashes * HASH_MULTIPLIER + shifted
+    return doc[valid], hashes[valid]
+
+
+def count_keys(doc, hashes):
+    with np.errstate(over="ignore"):
+        keys = hashes + doc.astype(np.uint64) * DOCUMENT_MULTIPLIER
+    order = np.argsort(keys)
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]][: len(keys)])
+    counts = np.diff(np.r_[starts, len(keys)])
+    return keys[starts], doc[order[starts]], counts
+
+
+def clipped_overlap(reference, candidate, size):
+    reference_keys, reference_doc, reference_count = count_keys(*reference)
+    candidate_keys, _, candidate_count = count_keys(*candidate)
+    if len(reference_keys) == 0 or len(candidate_keys) == 0:
+        return np.zeros(size)
+    position = np.minimum(
+        np.searchsorted(reference_keys, candidate_keys), len(reference_keys) - 1
+    )
+    shared = reference_keys[position] == candidate_keys
+    position = position[shared]
+    return np.bincount(
+        reference_doc[position],
+        weights=np.minimum(reference_count[position], candidate_count[shared]),
+        minlength=size,
+    )
+
+
+def f1(overlap, reference_total, candidate_total):
+    precision = np.divide(
+        overlap, candidate_total, out=np.zeros(len(overlap)), where=candidate_total > 0
+    )
+    recall = np.divide(
+        overlap, reference_total, out=np.zeros(len(overlap)), where=reference_total > 0
+    )
+    return np.divide(
+        2 * precision * recall,
+        precision + recall,
+        out=np.zeros(len(overlap)),
+        where=precision + recall > 0,
+    )
+
+
+def lcs_chunk(references, candidates):
+    # Bit-parallel LCS run for every pair at once: each reference is a
+    # multi-word bitset, and one row update per candidate token is a handful
+    # of array operations over all pairs in the chunk.
+    size = len(references)
+    reference_lengths = np.array([len(tokens) for tokens in references])
+    candidate_lengths = np.array([len(tokens) for tokens in candidates])
+    width = int(reference_lengths.max(initial=0))
+    steps = int(candidate_lengths.max(initial=0))
+    if width == 0 or steps == 0:
+        return np.zeros(size)
+    words = -(-width // 64)
+
+    # Key every token by (pair, token) so a candidate token finds the bitset
+    # of its positions in the same pair's reference with one searchsorted.
+    vocabulary, tokens = np.unique(
+        np.concatenate([*references, *candidates]), return_inverse=True
+    )
+    reference_total = int(reference_lengths.sum())
+    reference_pair = np.repeat(np.arange(size), reference_lengths)
+    candidate_pair = np.repeat(np.arange(size), candidate_lengths)
+    reference_keys = reference_pair * len(vocabulary) + tokens[:reference_total]
+    candidate_keys = candidate_pair * len(vocabulary) + tokens[reference_total:]
+    position = np.arange(reference_total) - np.repeat(
+        np.cumsum(reference_lengths) - reference_lengths, reference_lengths
+    )
+
+    keys, group = np.unique(reference_keys, return_inverse=True)
+    slots = group * words + position // 64
+    order = np.argsort(slots, kind="stable")
+    slots = slots[order]
+    starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+    # Positions within a slot are distinct bits, so their sum is their union.
+    bits = np.left_shift(np.uint64(1), (position[order] % 64).astype(np.uint64))
+    group_masks = np.zeros(len(keys) * words, dtype=np.uint64)
+    group_masks[slots[starts]] = np.add.reduceat(bits, starts)
+    group_masks = group_masks.reshape(len(keys), words)
+
+    found = np.minimum(np.searchsorted(keys, candidate_keys), len(keys) - 1)
+    shared = keys[found] == candidate_keys
+    step = np.arange(len(candidate_keys)) - np.repeat(
+        np.cumsum(candidate_lengths) - candidate_lengths, candidate_lengths
+    )
+    masks = np.zeros((steps, size, words), dtype=np.uint64)
+    masks[step[shared], candidate_pair[shared]] = group_masks[found[shared]]
+
+    full = np.zeros((size, words), dtype=np.uint64)
+    for word in range(words):
+        bits_left = np.clip(reference_lengths - 64 * word, 0, 64).astype(np.uint64)
+        full[:, word] = np.where(
+            bits_left == 64,
+            np.uint64(0xFFFFFFFFFFFFFFFF),
+            np.left_shift(np.uint64(1), bits_left % np.uint64(64)) - np.uint64(1),
+        )
+
+    row = full.copy()
+    for mask in masks:
+        matched = row & mask
+        # row - matched only clears bits, so only the sum needs a carry.
+        total = row + matched
+        carry = (total < row).astype(np.uint64)
+        for word in range(1, words):
+            total[:, word] += carry[:, word - 1]
+            carry[:, word] |= (total[:, word] < carry[:, word - 1]).astype(np.uint64)
+        row = (total | (row & ~matched)) & full
+    remaining = np.unpackbits(row.view(np.uint8), axis=1).sum(axis=1)
+    return reference_lengths - remaining
+
+
+def lcs_lengths(references, candidates, max_cells=1 << 24):
+    # Pairs of similar size share a chunk so padding stays small, and a chunk
+    # is capped by the size of its per-token match masks.
+    lengths = np.zeros(len(references))
+    order = sorted(
+        range(len(references)),
+        key=lambda idx: (len(references[idx]), len(candidates[idx])),
+    )
+    chunk = []
+    words = steps = 0
+    for idx in order + [None]:
+        if idx is not None:
+            next_words = max(words, -(-len(references[idx]) // 64))
+            next_steps = max(steps, len(candidates[idx]))
+            if not chunk or (len(chunk) + 1) * next_words * next_steps <= max_cells:
+                chunk.append(idx)
+                words, steps = next_words, next_steps
+                continue
+        lengths[chunk] = lcs_chunk(
+            [references[item] for item in chunk], [candidates[item] for item in chunk]
+        )
+        if idx is not None:
+            chunk = [idx]
+            words = -(-len(references[idx]) // 64)
+            steps = len(candidates[idx])
+    return lengths
+
+
+def score(references, candidates):
+    size = len(references)
+    if size == 0:
+        return {
+            name: np.zeros(0)
+            for name in ("rouge1", "rouge2", "bleu", "rougeL", "token_f1")
+        }
+    reference_tokens = [tokenize(text) for text in references]
+    candidate_tokens = [tokenize(text) for text in candidates]
+    reference_ids, reference_lengths = encode(reference_tokens)
+    candidate_ids, candidate_lengths = encode(candidate_tokens)
+
+    scores = {}
+    log_precisions = np.zeros(size)
+    for n in range(1, 5):
+        reference_grams = ngrams(reference_ids, reference_lengths, n)
+        candidate_grams = ngrams(candidate_ids, candidate_lengths, n)
+        overlap = clipped_overlap(reference_grams, candidate_grams, size)
+        reference_total = np.maximum(reference_lengths - n + 1, 0)
+        candidate_total = np.maximum(candidate_lengths - n + 1, 0)
+        if n <= 2:
+            scores[f"rouge{n}"] = f1(overlap, reference_total, candidate_total)
+        # Add-one smoothing for the higher orders keeps short summaries
+        # from collapsing to a BLEU of zero.
+        smoothing = 0 if n == 1 else 1
+        log_precisions += np.log(
+            np.maximum(overlap + smoothing, 1e-9)
+            / np.maximum(candidate_total + smoothing, 1)
+        )
+    brevity = np.where(
+        candidate_lengths >= reference_lengths,
+        1.0,
+        np.exp(1 - reference_lengths / np.maximum(candidate_lengths, 1)),
+    )
+    scores["bleu"] = np.where(
+        candidate_lengths > 0, brevity * np.exp(log_precisions / 4), 0.0
+    )
+
+    reference_splits = np.split(reference_ids, np.cumsum(reference_lengths)[:-1])
+    candidate_splits = np.split(candidate_ids, np.cumsum(candidate_lengths)[:-1])
+    lcs = lcs_lengths(reference_splits, candidate_splits)
+    scores["rougeL"] = f1(lcs, reference_lengths, candidate_lengths)
+
+    reference_content = [
+        [token for token in tokens if token not in ARTICLES]
+        for tokens in reference_tokens
+    ]
+    candidate_content = [
+        [token for token in tokens if token not in ARTICLES]
+        for tokens in candidate_tokens
+    ]
+    reference_ids, reference_lengths = encode(reference_content)
+    candidate_ids, candidate_lengths = encode(candidate_content)
+    overlap = clipped_overlap(
+        ngrams(reference_ids, reference_lengths, 1),
+        ngrams(candidate_ids, candidate_lengths, 1),
+        size,
+    )
+    scores["token_f1"] = f1(overlap, reference_lengths, candidate_lengths)
+    return scores
+
+
+def score_results(papers):
+    return score(
+        [paper["gt_summary"] for paper in papers],
+        [paper["pred_summary"] for paper in papers],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--metric", default="rougeL")
+    parser.add_argument("--ambiguous", nargs=2, type=float, default=None)
+    args = parser.parse_args()
+
+    for path in args.files:
+        with open(path, "r", encoding="utf-16") as file:
+            papers = json.load(file)
+        started = time.perf_counter()
+        scores = score_results(papers)
+        elapsed = time.perf_counter() - started
+        means = {
+            name: round(float(values.mean()), 4) for name, values in scores.items()
+        }
+        print(f"{path}: {means} ({len(papers) / elapsed:.0f} summaries/s)")
+        if args.ambiguous is not None:
+            low, high = args.ambiguous
+            values = scores[args.metric]
+            ambiguous = [
+                paper["id"]
+                for paper, value in zip(papers, values)
+                if low <= value <= high
+            ]
+            print(f"{path}: {len(ambiguous)} ambiguous by {args.metric}: {ambiguous}")
@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+
+from aiohttp import web
+
+DELIMITED = re.compile(r"------------\n(.*?)\n------------", re.DOTALL)
+BATCH_LABEL = re.compile(r"^([A-Z]): <score>$", re.MULTILINE)
+
+
+def mock_reply(prompt, summary_words=40):
+    score = zlib.crc32(prompt.encode("utf-8")) % 101 / 100
+    labels = BATCH_LABEL.findall(prompt)
+    if labels:
+        return "\n".join(
+            f"{label}: {(score + idx * 0.07) % 1:.2f}"
+            for idx, label in enumerate(labels)
+        )
+    if "score the predicted summary" in prompt:
+        return f"Score: {score:.2f}"
+    blocks = DELIMITED.findall(prompt)
+    words = (blocks[-1] if blocks else prompt).split()
+    return " ".join(words[:summary_words])
+
+
+class MockServer:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.05,
+        jitter=0.0,
+        error_rate=0.0,
+        requests_per_second=None,
+        max_concurrency=None,
+        tokens_per_second=None,
+        seed=0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.tokens_per_second = tokens_per_second
+        self.random = random.Random(seed)
+        self.tokens = max(1.0, requests_per_second) if requests_per_second else 0
+        self.updated = time.monotonic()
+        self.runner = None
+        self.connections = set()
+        self.stats = {
+            "requests": 0,
+            "responses": 0,
+            "errors": 0,
+            "throttled": 0,
+            "overloaded": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+        }
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/api/chat", self.openchat)
+        app.router.add_post("/v1/chat/completions", self.completions)
+        app.router.add_get("/stats", self.report)
+        return app
+
+    def _throttled(self):
+        if self.requests_per_second is None:
+            return False
+        now = time.monotonic()
+        # Below one request per second the bucket still has to hold one.
+        self.tokens = min(
+            max(1.0, self.requests_per_second),
+            self.tokens + (now - self.updated) * self.requests_per_second,
+        )
+        self.updated = now
+        if self.tokens < 1:
+            return True
+        self.tokens -= 1
+        return False
+
+    async def _handle(self, request, respond):
+        body = await request.read()
+        self.stats["requests"] += 1
+        self.stats["bytes_in"] += len(body)
+        self.connections.add(request.transport.get_extra_info("peername"))
+        if self._throttled():
+            self.stats["throttled"] += 1
+            retry_after = f"{1 / self.requests_per_second:.3f}"
+            return web.Response(status=429, headers={"Retry-After": retry_after})
+        if (
+            self.max_concurrency is not None
+            and self.stats["in_flight"] >= self.max_concurrency
+        ):
+            self.stats["overloaded"] += 1
+            return web.Response(status=503)
+
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(
+            self.stats["peak_in_flight"], self.stats["in_flight"]
+        )
+        try:
+            await asyncio.sleep(
+                max(0.0, self.latency + self.random.uniform(-1, 1) * self.jitter)
+            )
+            if self.random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return web.Response(status=500, text="mock failure")
+            payload = json.loads(body)
+            prompt = "".join(message["content"] for message in payload["messages"])
+            response = await respond(request, payload, mock_reply(prompt))
+            self.stats["responses"] += 1
+            return response
+        finally:
+            self.stats["in_flight"] -= 1
+
+    async def _stream(self, request, pieces, content_type):
+        response = web.StreamResponse(headers={"Content-Type": content_type})
+        await response.prepare(request)
+        for piece in pieces:
+            data = piece.encode("utf-8")
+            self.stats["bytes_out"] += len(data)
+            await response.write(data)
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+        await response.write_eof()
+        return response
+
+    async def openchat(self, request):
+        async def respond(request, payload, reply):
+            words = reply.split(" ")
+            pieces = [
+                word if idx == 0 else f" {word}" for idx, word in enumerate(words)
+            ]
+            return await self._stream(request, pieces, "text/plain; charset=utf-8")
+
+        return await self._handle(request, respond)
+
+    async def completions(self, request):
+        async def respond(request, payload, reply):
+            if payload.get("stream"):
+                pieces = [
+                    "data: "
+                    + json.dumps(
+                        {"choices": [{"delta": {"content": word}, "index": 0}]}
+                    )
+                    + "\n\n"
+                    for word in re.findall(r"\s*\S+", reply)
+                ]
+                return await self._stream(
+                    request, [*pieces, "data: [DONE]\n\n"], "text/event-stream"
+                )
+            body = json.dumps(
+                {
+                    "object": "chat.completion",
+                    "model": payload.get("model"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            )
+            self.stats["bytes_out"] += len(body)
+            return web.Response(text=body, content_type="application/json")
+
+        return await self._handle(request, respond)
+
+    async def report(self, request):
+        return web.json_response({**self.stats, "connections": len(self.connections)})
+
+    async def __aenter__(self):
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests-per-second", type=float, default=None)
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockServer(**vars(args))
+    print(f"Mock chat server on {server.url}/api/chat and {server.url}/v1")
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
@@ -0,0 +1,69 @@
+import re
+
+from client import estimate_tokens
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def prompt_token_budget(payload, backend, output_tokens=1024):
+    token_limit, max_length = backend.limits(payload)
+    prompt = "".join(message["content"] for message in payload["messages"])
+    token_budget = min(
+        token_limit - estimate_tokens(prompt) - output_tokens,
+        (max_length - len(prompt)) // 4,
+    )
+    if token_budget < 1:
+        raise ValueError(
+            f"prompt leaves no room for text: {estimate_tokens(prompt)} prompt "
+            f"tokens and {output_tokens} output tokens exceed the backend limits"
+        )
+    return token_budget
+
+
+def split_text(text, token_budget):
+    if token_budget < 1:
+        raise ValueError(f"token budget must be at least 1, got {token_budget}")
+    if estimate_tokens(text) <= token_budget:
+        return [text]
+
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        while estimate_tokens(sentence) > token_budget:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[: token_budget * 4])
+            sentence = sentence[token_budget * 4 :]
+        candidate = f"{current} {sentence}" if current else sentence
+        if estimate_tokens(candidate) > token_budget:
+            pieces.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_texts(texts, token_budget, separator="\n\n"):
+    chunks = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        if not text or not text.strip():
+            continue
+        for piece in split_text(text, token_budget):
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > token_budget:
+                chunks.append(separator.join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += tokens + 1
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def pack_sections(sections, token_budget):
+    return pack_texts([section["text"] for section in sections], token_budget)
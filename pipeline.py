@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+from asgiref.sync import async_to_sync
+
+import cot_summarization
+import evaluate
+import summarization
+from checkpoint import Checkpoint
+from client import ChatClient, add_client_arguments, client_options
+from corpus import load_corpus
+from failures import DeadLetters, add_failure_arguments, describe
+from instrumentation import (
+    add_instrumentation_arguments,
+    get_tracer,
+    instrumented,
+    trace_context,
+)
+from lxml_parser import parse_paper
+from prompts import add_prompt_arguments, load_prompts
+from scrap_for_paper import URLS, fetch_html, paper_id
+
+CONFIGURATIONS = [*summarization.CONFIGURATIONS, ("chain_of_thought", "none")]
+
+STOP = object()
+
+
+class Stage:
+    def __init__(self, name, handler, workers, queue_size):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.inbox = asyncio.Queue(queue_size)
+        self.counters = {"in": 0, "out": 0, "errors": 0, "busy": 0.0}
+
+    async def run(self, downstream=None):
+        async def worker():
+            while (item := await self.inbox.get()) is not STOP:
+                self.counters["in"] += 1
+                started = time.monotonic()
+                try:
+                    async for result in self.handler(item):
+                        self.counters["out"] += 1
+                        if downstream is not None:
+                            await downstream.inbox.put(result)
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    get_tracer().emit("stage_error", stage=self.name, error=repr(e))
+                self.counters["busy"] += time.monotonic() - started
+
+        await asyncio.gather(*[worker() for _ in range(self.workers)])
+        if downstream is not None:
+            for _ in range(downstream.workers):
+                await downstream.inbox.put(STOP)
+
+    def report(self, elapsed):
+        return {
+            **self.counters,
+            "busy": round(self.counters["busy"], 3),
+            "queued": self.inbox.qsize(),
+            "per_second": round(self.counters["out"] / elapsed, 3) if elapsed else 0,
+        }
+
+
+async def report_progress(stages, started, interval):
+    while True:
+        await asyncio.sleep(interval)
+        elapsed = time.monotonic() - started
+        print({stage.name: stage.report(elapsed) for stage in stages})
+
+
+async def run_pipeline(
+    urls=None,
+    papers=None,
+    configurations=CONFIGURATIONS,
+    output_dir=".",
+    cache_dir="html_cache",
+    scrape_workers=8,
+    summarize_workers=16,
+    evaluate_workers=16,
+    queue_size=32,
+    report_interval=10,
+    cot_mode="linear",
+    dead_letters=None,
+    resume=False,
+    **client_options,
+):
+    dead_letters = dead_letters or DeadLetters()
+    paths = {
+        configuration: os.path.join(
+            output_dir, "{}_generated_summaries_{}.jsonl".format(*configuration)
+        )
+        for configuration in configurations
+    }
+    evaluations_path = os.path.join(output_dir, "evaluations.jsonl")
+    if not resume:
+        for path in [*paths.values(), evaluations_path]:
+            if os.path.exists(path):
+                os.remove(path)
+    checkpoints = {
+        configuration: Checkpoint(path) for configuration, path in paths.items()
+    }
+    evaluations = Checkpoint(evaluations_path)
+    # A configuration is done for a paper once its summary has been judged;
+    # a summary without a judgement is recomputed, mostly from the cache.
+    completed = {
+        configuration: checkpoints[configuration].completed_ids()
+        & evaluations.completed_ids(
+            method=configuration[0], summary_type=configuration[1]
+        )
+        for configuration in configurations
+    }
+    done = set.intersection(*completed.values()) if completed else set()
+    os.makedirs(cache_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+
+    async def scrape(url):
+        try:
+            content = await fetch_html(session, url, cache_dir)
+            paper = await loop.run_in_executor(pool, parse_paper, content, url)
+        except Exception as e:
+            dead_letters.record("scrape", [describe(e)], url=url)
+            return
+        yield paper
+
+    async def summarize_configuration(paper, configuration):
+        method, summary_type = configuration
+        unit = {"paper_id": paper["id"], "configuration": f"{method}-{summary_type}"}
+        if method == "chain_of_thought":
+            unit["mode"] = cot_mode
+        try:
+            if method == "chain_of_thought":
+                result_dict = await cot_summarization.TASKS[cot_mode](client, paper)
+            else:
+                result_dict = await summarization.summarize_paper(
+                    client, paper, method, summary_type
+                )
+        except Exception as e:
+            # The paper's other configurations still go through.
+            dead_letters.record("summarize", [describe(e)], **unit)
+            return configuration, None
+        if result_dict is not None and "failed_sections" in result_dict:
+            dead_letters.record(
+                "summarize", result_dict["failed_sections"], partial=True, **unit
+            )
+        return configuration, result_dict
+
+    async def summarize(paper):
+        for task in asyncio.as_completed(
+            [
+                summarize_configuration(paper, configuration)
+                for configuration in configurations
+                if paper["id"] not in completed[configuration]
+            ]
+        ):
+            configuration, result_dict = await task
+            if result_dict is None:
+                continue
+            checkpoints[configuration].append(result_dict)
+            yield configuration, result_dict
+
+    async def judge(item):
+        (method, summary_type), result_dict = item
+        unit = {
+            "paper_id": result_dict["id"],
+            "configuration": f"{method}-{summary_type}",
+        }
+        with trace_context(stage="evaluate", **unit):
+            try:
+                response = await client.post(
+                    evaluate.generate_payload(
+                        result_dict["gt_summary"],
+                        result_dict["pred_summary"],
+                        client.backend,
+                    )
+                )
+            except Exception as e:
+                dead_letters.record("evaluate", [describe(e)], **unit)
+                return
+        record = {
+            "id": result_dict["id"],
+            "method": method,
+            "summary_type": summary_type,
+            "response": response,
+        }
+        evaluations.append(record)
+        yield record
+
+    stages = [
+        Stage("summarize", summarize, summarize_workers, queue_size),
+        Stage("evaluate", judge, evaluate_workers, queue_size),
+    ]
+    if papers is None:
+        stages.insert(0, Stage("scrape", scrape, scrape_workers, queue_size))
+
+    async def feed():
+        for item in urls if papers is None else papers:
+            if (paper_id(item) if papers is None else item["id"]) in done:
+                continue
+            await stages[0].inbox.put(item)
+        for _ in range(stages[0].workers):
+            await stages[0].inbox.put(STOP)
+
+    started = time.monotonic()
+    connector = aiohttp.TCPConnector(limit_per_host=scrape_workers, ttl_dns_cache=300)
+    with ProcessPoolExecutor() as pool:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async with ChatClient(**client_options) as client:
+                reporter = asyncio.ensure_future(
+                    report_progress(stages, started, report_interval)
+                )
+                await asyncio.gather(
+                    feed(),
+                    *[
+                        stage.run(stages[idx + 1] if idx + 1 < len(stages) else None)
+                        for idx, stage in enumerate(stages)
+                    ],
+                )
+                reporter.cancel()
+                print(f"Client: {client.report()}")
+    if dead_letters.count:
+        print(f"Dead letters: {dead_letters.count}")
+
+    elapsed = time.monotonic() - started
+    for checkpoint in [*checkpoints.values(), evaluations]:
+        checkpoint.close()
+    return {stage.name: stage.report(elapsed) for stage in stages}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    add_prompt_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_failure_arguments(parser, retry=False)
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--scrape-workers", type=int, default=8)
+    parser.add_argument("--summarize-workers", type=int, default=16)
+    parser.add_argument("--evaluate-workers", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument(
+        "--cot-mode", choices=sorted(cot_summarization.TASKS), default="linear"
+    )
+    args = parser.parse_args()
+    if args.prompts is not None:
+        load_prompts(args.prompts)
+
+    dead_letters = DeadLetters(args.dead_letters)
+    with instrumented(args):
+        report = async_to_sync(run_pipeline)(
+            urls=URLS,
+            papers=None if args.corpus is None else load_corpus(args.corpus),
+            output_dir=args.output_dir,
+            scrape_workers=args.scrape_workers,
+            summarize_workers=args.summarize_workers,
+            evaluate_workers=args.evaluate_workers,
+            queue_size=args.queue_size,
+            cot_mode=args.cot_mode,
+            dead_letters=dead_letters,
+            resume=args.resume,
+            **client_options(args),
+        )
+    dead_letters.close()
+    print(f"Stages: {report}")
@@ -0,0 +1,146 @@
+import json
+import os
+import string
+
+SLOT = "\x00"
+
+REGISTRY = {}
+ENVELOPES = {}
+PREFIXES = {}
+
+
+class PromptText(str):
+    # A rendered prompt that remembers its static prefix, so the prefix is
+    # JSON-encoded once per template rather than once per request.
+    def __new__(cls, text, prefix=""):
+        prompt = super().__new__(cls, text)
+        prompt.prefix = prefix
+        return prompt
+
+
+class PromptTemplate:
+    def __init__(self, name, template, temperature, max_length):
+        self.name = name
+        self.template = template
+        self.temperature = temperature
+        self.max_length = max_length
+        self.pieces = [
+            (literal, field)
+            for literal, field, _, _ in string.Formatter().parse(template)
+        ]
+        self.prefix = self.pieces[0][0] if self.pieces else ""
+
+    def render(self, **values):
+        return PromptText(
+            "".join(
+                literal + ("" if field is None else str(values[field]))
+                for literal, field in self.pieces
+            ),
+            self.prefix,
+        )
+
+    def payload(self, backend, **values):
+        return backend.build_payload(
+            self.render(**values),
+            temperature=self.temperature,
+            max_length=self.max_length,
+        )
+
+
+def register(name, template, temperature, max_length):
+    REGISTRY[name] = PromptTemplate(name, template, temperature, max_length)
+    return REGISTRY[name]
+
+
+def get_template(name):
+    return REGISTRY[name]
+
+
+def load_prompts(directory):
+    loaded = []
+    for file_name in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(file_name)
+        if extension != ".txt" or name not in REGISTRY:
+            continue
+        with open(os.path.join(directory, file_name), "r", encoding="utf-8") as file:
+            template = file.read()
+        register(name, template, REGISTRY[name].temperature, REGISTRY[name].max_length)
+        loaded.append(name)
+    return loaded
+
+
+def dump_prompts(directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, template in REGISTRY.items():
+        with open(
+            os.path.join(directory, f"{name}.txt"), "w", encoding="utf-8"
+        ) as file:
+            file.write(template.template)
+
+
+def add_prompt_arguments(parser):
+    parser.add_argument("--prompts", default=None)
+
+
+def encode_text(text):
+    prefix = getattr(text, "prefix", "")
+    if not prefix:
+        return json.dumps(text)
+    if prefix not in PREFIXES:
+        if len(PREFIXES) >= 256:
+            PREFIXES.clear()
+        PREFIXES[prefix] = json.dumps(prefix)[:-1]
+    # JSON escapes character by character, so the encoded prefix and the
+    # encoded remainder concatenate to exactly json.dumps(text).
+    return PREFIXES[prefix] + json.dumps(text[len(prefix) :])[1:]
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return (list, *(freeze(item) for item in value))
+    return value
+
+
+def encode_payload(payload):
+    # Messages are assumed to be {"role", "content"} pairs, as both backends
+    # build them, so only the roles take part in the envelope key.
+    messages = payload["messages"]
+    key = (
+        freeze({**payload, "messages": None}),
+        tuple(message["role"] for message in messages),
+    )
+    if key not in ENVELOPES:
+        if len(ENVELOPES) >= 256:
+            ENVELOPES.clear()
+        envelope = {
+            **payload,
+            "messages": [
+                {"role": message["role"], "content": SLOT} for message in messages
+            ],
+        }
+        ENVELOPES[key] = json.dumps(envelope).split(json.dumps(SLOT))
+    pieces = ENVELOPES[key]
+    body = [pieces[0]]
+    for message, piece in zip(messages, pieces[1:]):
+        body.append(encode_text(message["content"]))
+        body.append(piece)
+    return "".join(body).encode("utf-8")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # Importing the scripts registers their templates in the prompts module.
+    import cot_summarization
+    import evaluate
+    import prompts
+    import summarization
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", nargs="?", default="prompts")
+    args = parser.parse_args()
+
+    prompts.dump_prompts(args.directory)
+    print(f"Wrote {len(prompts.REGISTRY)} prompts to {args.directory}")
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_second=5.0,
+        burst=10,
+        max_concurrency=32,
+        min_requests_per_second=0.2,
+        max_requests_per_second=None,
+        recovery=0.05,
+    ):
+        if max_concurrency < 1:
+            raise ValueError(
+                f"max_concurrency must be at least 1, got {max_concurrency}"
+            )
+        if requests_per_second <= 0:
+            raise ValueError(
+                f"requests_per_second must be positive, got {requests_per_second}"
+            )
+        # requests_per_second is only the starting rate: successes raise it
+        # until the endpoint pushes back, or up to max_requests_per_second.
+        self.initial_rate = requests_per_second
+        self.max_rate = max_requests_per_second
+        self.rate = requests_per_second
+        self.min_rate = min_requests_per_second
+        self.recovery = recovery
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_penalty = 0.0
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.stats = {
+            "requests": 0,
+            "throttled": 0,
+            "throttle_wait": 0.0,
+            "backoffs": 0,
+        }
+
+    def _reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def _record_wait(self, delay, throttled):
+        if not throttled:
+            self.stats["throttled"] += 1
+        self.stats["throttle_wait"] += delay
+
+    async def acquire(self):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self.semaphore.acquire()
+        throttled = False
+        try:
+            while (delay := self._reserve()) > 0:
+                self._record_wait(delay, throttled)
+                throttled = True
+                await asyncio.sleep(delay)
+        except BaseException:
+            # A waiter cancelled mid-throttle must hand its permit back.
+            self.semaphore.release()
+            raise
+        self.stats["requests"] += 1
+
+    def release(self):
+        self.semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def penalize(self, retry_after=None):
+        now = time.monotonic()
+        # Responses already in flight when the endpoint pushed back should
+        # not each halve the rate again.
+        if now - self.last_penalty > 1 / self.rate:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.last_penalty = now
+        self.tokens = 0.0
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        self.paused_until = max(self.paused_until, now + pause)
+        self.stats["backoffs"] += 1
+
+    def reward(self):
+        self.rate += self.recovery * self.initial_rate
+        if self.max_rate is not None:
+            self.rate = min(self.max_rate, self.rate)
+
+    def report(self):
+        return {
+            **self.stats,
+            "throttle_wait": round(self.stats["throttle_wait"], 3),
+            "requests_per_second": round(self.rate, 3),
+        }
@@ -1,3 +1,7 @@
+import numpy as np
+
+from eval_store import aggregate
+
 results = {
     "few_shot-extractive": [
         "0.95",
@@ -167,9 +171,15 @@ results = {
 }
 
 
-def mean(values):
-    return sum(values) / len(values)
-
-
-for key, value in results.items():
-    print(key, mean([float(ele) for ele in value]))
+if __name__ == "__main__":
+    # Scores transcribed by hand before evaluate.py persisted them; papers are
+    # aligned by position across configurations.
+    labels = list(results)
+    summary, differences = aggregate(
+        np.array([[float(ele) for ele in results[label]] for label in labels]).T,
+        labels,
+    )
+    for key, value in summary.items():
+        print(key, value["mean"], value["ci"])
+    for key, value in differences.items():
+        print(key, value["mean"], value["ci"])
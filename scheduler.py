@@ -0,0 +1,22 @@
+import asyncio
+
+
+async def run_bounded(jobs, handler, max_pending, on_done=None):
+    pending = set()
+    for job in jobs:
+        if len(pending) >= max_pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+                if on_done is not None:
+                    on_done()
+        pending.add(asyncio.ensure_future(handler(job)))
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+            if on_done is not None:
+                on_done()
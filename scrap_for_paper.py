@@ -1,11 +1,22 @@
 import requests
+import argparse
+import asyncio
+import hashlib
+import os
 import re
 import json
+import time
 import uuid
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
 from bs4 import BeautifulSoup
 from bs4.element import PageElement
 
+from dedup import SectionIndex, dedupe_sections, refresh_report
+from instrumentation import add_instrumentation_arguments, get_tracer, instrumented
+
 
 def convert_math_to_latex_string(child: PageElement):
     if child.name == "math":
@@ -81,10 +92,9 @@ def parse_section_title_or_abstract_text(section, heading_tag):
     )
 
 
-def scrap_paper(url):
+def parse_paper(content, url):
     parsed_paper = {}
-    page = requests.get(url)
-    soup = BeautifulSoup(page.content, "html.parser")
+    soup = BeautifulSoup(content, "html.parser")
 
     article = soup.find("article", {"class": "ltx_document"})
     parsed_paper["title"] = parse_section_title_or_abstract_text(article, "h1")
@@ -151,10 +161,95 @@ def scrap_paper(url):
                 )
     parsed_paper["document"] = document_sections
     parsed_paper["url"] = url
-    parsed_paper["id"] = str(uuid.uuid4())
+    parsed_paper["id"] = paper_id(url)
     return parsed_paper
 
 
+def paper_id(url):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+
+
+def scrap_paper(url):
+    page = requests.get(url)
+    return parse_paper(page.content, url)
+
+
+def cache_paths(cache_dir, url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.html"), os.path.join(
+        cache_dir, f"{key}.json"
+    )
+
+
+async def fetch_html(session, url, cache_dir):
+    started = time.monotonic()
+    event = {"url": url, "status": None, "bytes": 0, "error": None}
+    try:
+        content = await fetch_cached_html(session, url, cache_dir, event)
+        event["bytes"] = len(content)
+        return content
+    except Exception as e:
+        event["error"] = repr(e)
+        raise
+    finally:
+        get_tracer().emit("fetch", latency=time.monotonic() - started, **event)
+
+
+async def fetch_cached_html(session, url, cache_dir, event):
+    html_path, meta_path = cache_paths(cache_dir, url)
+    headers = {}
+    if os.path.exists(html_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    async with session.get(url, headers=headers) as response:
+        event["status"] = response.status
+        if response.status == 304:
+            with open(html_path, "rb") as file:
+                return file.read()
+        response.raise_for_status()
+        content = await response.read()
+
+    with open(html_path, "wb") as file:
+        file.write(content)
+    with open(meta_path, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            },
+            file,
+        )
+    return content
+
+
+async def scrap_papers(
+    urls, cache_dir="html_cache", limit_per_host=8, processes=None, parse=parse_paper
+):
+    os.makedirs(cache_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    connector = aiohttp.TCPConnector(limit_per_host=limit_per_host, ttl_dns_cache=300)
+
+    async def scrap(url):
+        try:
+            content = await fetch_html(session, url, cache_dir)
+            return await loop.run_in_executor(pool, parse, content, url)
+        except Exception as e:
+            # One bad page should not abort the rest of the scrape.
+            get_tracer().emit("scrape_error", url=url, error=repr(e))
+            return None
+
+    with ProcessPoolExecutor(processes) as pool:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            papers = await asyncio.gather(*[scrap(url) for url in urls])
+    return [paper for paper in papers if paper is not None]
+
+
 URLS = [
     "https://ar5iv.labs.arxiv.org/html/2305.04856",
     "https://ar5iv.labs.arxiv.org/html/2305.04854",
@@ -189,6 +284,37 @@ URLS = [
     "https://ar5iv.labs.arxiv.org/html/2310.13662",
 ]
 
-# a = [scrap_paper(URL) for URL in URLS]
-# with open("papers.json", "w", encoding="utf-16") as f:
-#     json.dump(a, f, indent=4)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parser", choices=["html.parser", "lxml"], default="lxml")
+    parser.add_argument("--index", default="sections.sqlite")
+    parser.add_argument("--keep-duplicates", action="store_true")
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+
+    if args.parser == "lxml":
+        import lxml_parser
+
+        parse = lxml_parser.parse_paper
+    else:
+        parse = parse_paper
+    with instrumented(args):
+        papers = asyncio.run(scrap_papers(URLS, parse=parse))
+    if not args.keep_duplicates:
+        duplicates = 0
+        for paper in papers:
+            paper["document"], dropped = dedupe_sections(paper["document"])
+            duplicates += len(dropped)
+        print(f"Dropped {duplicates} duplicate sections")
+
+    index = SectionIndex(args.index)
+    report = refresh_report([index.update(paper) for paper in papers])
+    index.close()
+    with open("refresh.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(
+        f"{len(report['new'])} new, {len(report['changed'])} changed, "
+        f"{len(report['unchanged'])} unchanged papers"
+    )
+    with open("papers.json", "w", encoding="utf-16") as f:
+        json.dump(papers, f, indent=4)
@@ -1,122 +1,310 @@
-import requests
+import argparse
 import asyncio
+import os
 
-import aiohttp
-from aiohttp_retry import ExponentialRetry, RetryClient
 from asgiref.sync import async_to_sync
+from tqdm import tqdm
 
-import json
-import time
+from backends import DEFAULT_BACKEND
+from checkpoint import Checkpoint
+from client import ChatClient, add_client_arguments, client_options
+from corpus import load_corpus
+from dedup import dedupe_sections, load_changed_ids
+from failures import (
+    DeadLetters,
+    RequestFailed,
+    add_failure_arguments,
+    describe,
+    settle,
+)
+from instrumentation import (
+    add_instrumentation_arguments,
+    instrumented,
+    trace_context,
+    traced,
+)
+from packing import pack_sections, pack_texts, prompt_token_budget, split_text
+from prompts import add_prompt_arguments, get_template, load_prompts, register
+from scheduler import run_bounded
 
-from tqdm import tqdm
+register(
+    "zero_shot-abstractive",
+    """Your job is to produce summaries\n\nWrite a concise summary of the following:\n\n------------\n{text}\n------------\n""",
+    temperature=0.2,
+    max_length=30000,
+)
+
+register(
+    "zero_shot-extractive",
+    """Your job is to produce summaries\n\nWrite a concise extractive summary of the following by selecting the key sentences that convey the gist of the given text and output them verbatim without any changes, paraphrasing, or rephrasing:\n\n------------\n{text}\n------------\n""",
+    temperature=0.2,
+    max_length=30000,
+)
+
+register(
+    "few_shot-extractive",
+    """Your job is to produce summaries\n\nHere are a few training examples of the summarization task:\n------------\n"Text"\nChelsea are waiting on the fitness of John Terry ahead of Wednesday's Champions League match with Valencia, but Frank Lampard has been ruled out. John Terry tries out his protective mask during training for Chelsea on Tuesday. Center-back Terry suffered a broken cheekbone during Saturday's 0-0 draw with Fulham, and Chelsea manager Avram Grant will see how he fares during training on Tuesday before making a decision on his availability. Terry trained at Valencia's Mestalla stadium with a face mask on after surgery on Sunday. "John Terry wants to play which is very good. Now we need to wait for training and then we will speak with the medical department and decide," said Grant. Grant has confirmed that Lampard will definitely sit the game out though as the midfielder continues to recover from his thigh injury. Midfielder Michael Essien, who scored a last-minute winner for Chelsea to knock Valencia out of last season's Champions League, has also been battling a leg injury but he took part in training on Tuesday and is expected to play.\n"Summary"\nChelsea are still waiting on the fitness of John Terry ahead of the Champions League match with Valencia. Frank Lampard will definitely sit the game out though as the midfielder continues to recover from his thigh injury. Michael Essien has also been battling a leg injury but he took part in training on Tuesday and is expected to play.\n------------\n\nNow, write a concise extractive summary of the following by selecting the key sentences that convey the gist of the given text and output them verbatim without any changes, paraphrasing, or rephrasing:\n\n------------\n{text}\n------------\n""",
+    temperature=0.2,
+    max_length=30000,
+)
+
+register(
+    "few_shot-abstractive",
+    """Your job is to produce summaries\n\nHere are a few training examples of the summarization task:\n------------\n"Text"\nVice President Dick Cheney will serve as acting president briefly Saturday while President Bush is anesthetized for a routine colonoscopy, White House spokesman Tony Snow said Friday. Bush is scheduled to have the medical procedure, expected to take about 2 1/2 hours, at the presidential retreat at Camp David, Maryland, Snow said. Bush's last colonoscopy was in June 2002, and no abnormalities were found, Snow said. The president's doctor had recommended a repeat procedure in about five years. The procedure will be supervised by Dr. Richard Tubb and conducted by a multidisciplinary team from the National Naval Medical Center in Bethesda, Maryland, Snow said. A colonoscopy is the most sensitive test for colon cancer, rectal cancer and polyps, small clumps of cells that can become cancerous, according to the Mayo Clinic. Small polyps may be removed during the procedure. Snow said that was the case when Bush had colonoscopies before becoming president. Snow himself is undergoing chemotherapy for cancer that began in his colon and spread to his liver. Snow told reporters he had a chemo session scheduled later Friday. Watch Snow talk about Bush's procedure and his own colon cancer. "The president wants to encourage everybody to use surveillance," Snow said. The American Cancer Society recommends that people without high-risk factors or symptoms begin getting screened for signs of colorectal cancer at age 50.\n"Summary"\nPresident Bush will have a routine colonoscopy Saturday. While he's anesthetized, his powers will be transferred to the vice president. Bush had last colonoscopy in 2002, which found no problems.\n------------\n\nNow, write a concise summary of the following:\n\n------------\n{text}\n------------\n""",
+    temperature=0.2,
+    max_length=30000,
+)
+
+
+def generate_payload(text, method, summary_type, backend=DEFAULT_BACKEND):
+    return get_template(f"{method}-{summary_type}").payload(backend, text=text)
+
+
+CONFIGURATIONS = [
+    ("few_shot", "extractive"),
+    ("zero_shot", "extractive"),
+    ("few_shot", "abstractive"),
+    ("zero_shot", "abstractive"),
+]
 
 
-def generate_payload(text, method, summary_type):
-    if method == "zero_shot" and summary_type == "abstractive":
-        prompt_text = f"""Your job is to produce summaries\n\nWrite a concise summary of the following:\n\n------------\n{text}\n------------\n"""
-    elif method == "zero_shot" and summary_type == "extractive":
-        prompt_text = f"""Your job is to produce summaries\n\nWrite a concise extractive summary of the following by selecting the key sentences that convey the gist of the given text and output them verbatim without any changes, paraphrasing, or rephrasing:\n\n------------\n{text}\n------------\n"""
-    elif method == "few_shot" and summary_type == "extractive":
-        prompt_text = f"""Your job is to produce summaries\n\nHere are a few training examples of the summarization task:\n------------\n"Text"\nChelsea are waiting on the fitness of John Terry ahead of Wednesday's Champions League match with Valencia, but Frank Lampard has been ruled out. John Terry tries out his protective mask during training for Chelsea on Tuesday. Center-back Terry suffered a broken cheekbone during Saturday's 0-0 draw with Fulham, and Chelsea manager Avram Grant will see how he fares during training on Tuesday before making a decision on his availability. Terry trained at Valencia's Mestalla stadium with a face mask on after surgery on Sunday. "John Terry wants to play which is very good. Now we need to wait for training and then we will speak with the medical department and decide," said Grant. Grant has confirmed that Lampard will definitely sit the game out though as the midfielder continues to recover from his thigh injury. Midfielder Michael Essien, who scored a last-minute winner for Chelsea to knock Valencia out of last season's Champions League, has also been battling a leg injury but he took part in training on Tuesday and is expected to play.\n"Summary"\nChelsea are still waiting on the fitness of John Terry ahead of the Champions League match with Valencia. Frank Lampard will definitely sit the game out though as the midfielder continues to recover from his thigh injury. Michael Essien has also been battling a leg injury but he took part in training on Tuesday and is expected to play.\n------------\n\nNow, write a concise extractive summary of the following by selecting the key sentences that convey the gist of the given text and output them verbatim without any changes, paraphrasing, or rephrasing:\n\n------------\n{text}\n------------\n"""
-    elif method == "few_shot" and summary_type == "abstractive":
-        prompt_text = f"""Your job is to produce summaries\n\nHere are a few training examples of the summarization task:\n------------\n"Text"\nVice President Dick Cheney will serve as acting president briefly Saturday while President Bush is anesthetized for a routine colonoscopy, White House spokesman Tony Snow said Friday. Bush is scheduled to have the medical procedure, expected to take about 2 1/2 hours, at the presidential retreat at Camp David, Maryland, Snow said. Bush's last colonoscopy was in June 2002, and no abnormalities were found, Snow said. The president's doctor had recommended a repeat procedure in about five years. The procedure will be supervised by Dr. Richard Tubb and conducted by a multidisciplinary team from the National Naval Medical Center in Bethesda, Maryland, Snow said. A colonoscopy is the most sensitive test for colon cancer, rectal cancer and polyps, small clumps of cells that can become cancerous, according to the Mayo Clinic. Small polyps may be removed during the procedure. Snow said that was the case when Bush had colonoscopies before becoming president. Snow himself is undergoing chemotherapy for cancer that began in his colon and spread to his liver. Snow told reporters he had a chemo session scheduled later Friday. Watch Snow talk about Bush's procedure and his own colon cancer. "The president wants to encourage everybody to use surveillance," Snow said. The American Cancer Society recommends that people without high-risk factors or symptoms begin getting screened for signs of colorectal cancer at age 50.\n"Summary"\nPresident Bush will have a routine colonoscopy Saturday. While he's anesthetized, his powers will be transferred to the vice president. Bush had last colonoscopy in 2002, which found no problems.\n------------\n\nNow, write a concise summary of the following:\n\n------------\n{text}\n------------\n"""
-
-    return {
-        "model": {
-            "id": "openchat_v3.2_mistral",
-            "name": "OpenChat Aura",
-            "maxLength": 30000,
-            "tokenLimit": 8192,
-        },
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt_text,
-            }
-        ],
-        "key": "",
-        "prompt": " ",
-        "temperature": 0.2,
-    }
-
-
-async def generate_summary(url, payload, response_list, request_index):
-    retry_options = ExponentialRetry(
-        attempts=5, statuses=[500], exceptions={aiohttp.ClientConnectorError}
+async def combine_summaries(client, summaries, method, summary_type, token_budget):
+    truncated = False
+    groups = pack_texts(summaries, token_budget, separator="\n")
+    while len(groups) > 1:
+        summaries = await asyncio.gather(
+            *[
+                traced(
+                    client.post(
+                        generate_payload(group, method, summary_type, client.backend)
+                    ),
+                    step="combine",
+                    section=idx,
+                )
+                for idx, group in enumerate(groups)
+            ]
+        )
+        next_groups = pack_texts(summaries, token_budget, separator="\n")
+        if len(next_groups) >= len(groups):
+            # The summaries stopped shrinking; give each the same share of one
+            # prompt so the end of the paper is not dropped, and flag it.
+            truncated = True
+            share = max(1, token_budget // len(summaries))
+            next_groups = split_text(
+                "\n".join(
+                    split_text(summary, share)[0]
+                    for summary in summaries
+                    if summary and summary.strip()
+                ),
+                token_budget,
+            )[:1]
+        groups = next_groups
+    if not groups:
+        return None, truncated
+    summary = await traced(
+        client.post(generate_payload(groups[0], method, summary_type, client.backend)),
+        step="combine",
+        section=None,
     )
-    async with RetryClient(
-        retry_options=retry_options, raise_for_status=False
-    ) as client:
-        async with client.post(
-            url,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        ) as response:
-            if response.status == 200:
-                try:
-                    response_list[request_index] = await response.text()
-                except Exception as e:
-                    print(e)
-            else:
-                print(response.status)
+    return summary, truncated
 
 
-@async_to_sync
-async def get_summaries(papers, method, summary_type):
-    generated_summaries = []
-    for paper in tqdm(papers):
-        result_dict = {}
-
-        result_dict["title"] = paper["title"]
-        result_dict["gt_summary"] = paper["summary"]
-        result_dict["id"] = paper["id"]
-
-        sectionwise_summaries = [None] * len(paper["document"])
-        tasks = [
-            asyncio.ensure_future(
-                generate_summary(
-                    "https://openchat.team/api/chat",
-                    generate_payload(section["text"], method, summary_type),
-                    sectionwise_summaries,
-                    idx,
+async def summarize_paper(client, paper, method, summary_type, token_budget=None):
+    result_dict = {}
+
+    result_dict["title"] = paper["title"]
+    result_dict["gt_summary"] = paper["summary"]
+    result_dict["id"] = paper["id"]
+
+    if token_budget is None:
+        token_budget = prompt_token_budget(
+            generate_payload("", method, summary_type, client.backend), client.backend
+        )
+    # Repeated text, such as a subsection nested inside its parent, is only
+    # sent once.
+    sections, _ = dedupe_sections(paper["document"])
+    if not any(section["text"].strip() for section in sections):
+        # Dead-lettered like a failed request, instead of a "None" summary.
+        raise RequestFailed("no_text", "the paper has no section text")
+    with trace_context(paper_id=paper["id"], stage=f"{method}-{summary_type}"):
+        sectionwise_summaries = await settle(
+            [
+                traced(
+                    client.post(
+                        generate_payload(chunk, method, summary_type, client.backend)
+                    ),
+                    step="section",
+                    section=idx,
                 )
-            )
-            for idx, section in enumerate(paper["document"])
+                for idx, chunk in enumerate(pack_sections(sections, token_budget))
+            ]
+        )
+        failed = [
+            (idx, summary)
+            for idx, summary in enumerate(sectionwise_summaries)
+            if isinstance(summary, Exception)
         ]
+        if failed and len(failed) == len(sectionwise_summaries):
+            raise failed[0][1]
 
-        await asyncio.gather(*tasks)
+        result_dict["pred_summary"], truncated = await combine_summaries(
+            client,
+            [
+                summary
+                for summary in sectionwise_summaries
+                if not isinstance(summary, Exception)
+            ],
+            method,
+            summary_type,
+            token_budget,
+        )
+        if result_dict["pred_summary"] is None:
+            raise RequestFailed("empty_response", "every section summary was empty")
 
-        result_dict["pred_summary"] = requests.post(
-            "https://openchat.team/api/chat",
-            json=generate_payload(
-                "\n".join(sectionwise_summaries), method, summary_type
-            ),
-            headers={"Content-Type": "application/json"},
-        ).text
+    result_dict["extraction_type"] = summary_type
+    if truncated:
+        result_dict["truncated"] = True
+    if failed:
+        # A partial summary of the sections that did succeed.
+        result_dict["failed_sections"] = [
+            describe(error, section=idx) for idx, error in failed
+        ]
+    return result_dict
 
-        result_dict["extraction_type"] = summary_type
-        generated_summaries.append(result_dict)
 
-        time.sleep(1)
+async def summarize_corpus(
+    papers,
+    configurations,
+    on_result,
+    completed=None,
+    max_pending=32,
+    token_budget=None,
+    dead_letters=None,
+    **client_options,
+):
+    completed = completed or {}
+    dead_letters = dead_letters or DeadLetters()
 
+    async def run(job):
+        configuration, idx, paper = job
+        unit = {"paper_id": paper["id"], "configuration": "-".join(configuration)}
+        try:
+            result_dict = await summarize_paper(
+                client, paper, *configuration, token_budget
+            )
+        except Exception as e:
+            dead_letters.record("summarize", [describe(e)], **unit)
+            return
+        on_result(configuration, idx, result_dict)
+        if "failed_sections" in result_dict:
+            dead_letters.record(
+                "summarize", result_dict["failed_sections"], partial=True, **unit
+            )
+
+    jobs = (
+        (configuration, idx, paper)
+        for configuration in configurations
+        for idx, paper in enumerate(papers)
+        if paper["id"] not in completed.get(configuration, ())
+    )
+    total = sum(
+        len(papers) - len(completed.get(configuration, ()))
+        for configuration in configurations
+    )
+    async with ChatClient(**client_options) as client:
+        with tqdm(total=total) as progress:
+            await run_bounded(jobs, run, max_pending, progress.update)
+        print(f"Client: {client.report()}")
+    if dead_letters.count:
+        print(f"Dead letters: {dead_letters.count}")
+
+
+@async_to_sync
+async def get_summaries(papers, method, summary_type, **client_options):
+    generated_summaries = [None] * len(papers)
+
+    def on_result(configuration, idx, result_dict):
+        generated_summaries[idx] = result_dict
+
+    await summarize_corpus(
+        papers,
+        [(method, summary_type)],
+        on_result,
+        **client_options,
+    )
     return generated_summaries
 
 
 if __name__ == "__main__":
-    with open("papers.json", "r", encoding="utf-16") as file:
-        papers = json.load(file)
-
-    for method, summary_type in [
-        ("few_shot", "extractive"),
-        ("zero_shot", "extractive"),
-        ("few_shot", "abstractive"),
-        ("zero_shot", "abstractive"),
-    ]:
-        print(f"Generating summaries for '{method}-{summary_type}'")
-        generated_summaries = get_summaries(papers, method, summary_type)
-        with open(
-            f"{method}_generated_summaries_{summary_type}.json", "w", encoding="utf-16"
-        ) as file:
-            json.dump(generated_summaries, file, indent=4)
-        print(f"Summaries generated'")
-        print("--------------------------")
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    add_prompt_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_failure_arguments(parser)
+    parser.add_argument("--corpus", default="papers.json")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--token-budget", type=int, default=None)
+    parser.add_argument("--refresh", default=None)
+    args = parser.parse_args()
+    if args.token_budget is not None and args.token_budget < 1:
+        parser.error("--token-budget must be at least 1")
+    if args.refresh is not None:
+        # A refresh re-summarizes only the changed papers, so it always builds
+        # on the existing output.
+        args.resume = True
+    if args.prompts is not None:
+        load_prompts(args.prompts)
+
+    papers = load_corpus(args.corpus)
+    changed = set() if args.refresh is None else load_changed_ids(args.refresh)
+    dead_letters = DeadLetters(args.dead_letters)
+    labels = {"-".join(configuration) for configuration in CONFIGURATIONS}
+    retried = {}
+    if args.retry_dead_letters:
+        # Replay only the dead-lettered units on top of the existing outputs.
+        for entry in dead_letters.take(
+            lambda entry: entry["stage"] == "summarize"
+            and entry["configuration"] in labels
+        ):
+            retried.setdefault(tuple(entry["configuration"].split("-")), set()).add(
+                entry["paper_id"]
+            )
+
+    checkpoints = {}
+    for method, summary_type in CONFIGURATIONS:
+        path = f"{method}_generated_summaries_{summary_type}.jsonl"
+        if not (args.resume or args.retry_dead_letters) and os.path.exists(path):
+            os.remove(path)
+        checkpoints[(method, summary_type)] = Checkpoint(path)
+
+    print(f"Generating summaries for {len(CONFIGURATIONS)} configurations")
+    with instrumented(args):
+        async_to_sync(summarize_corpus)(
+            papers,
+            CONFIGURATIONS,
+            lambda configuration, idx, result_dict: checkpoints[configuration].append(
+                result_dict
+            ),
+            completed={
+                configuration: (
+                    set(papers.ids()) - retried.get(configuration, set())
+                    if args.retry_dead_letters
+                    else checkpoint.completed_ids() - changed
+                )
+                for configuration, checkpoint in checkpoints.items()
+            },
+            max_pending=args.max_pending,
+            token_budget=args.token_budget,
+            dead_letters=dead_letters,
+            **client_options(args),
+        )
+    dead_letters.close()
+    paper_ids = papers.ids()
+    for (method, summary_type), checkpoint in checkpoints.items():
+        checkpoint.export(
+            f"{method}_generated_summaries_{summary_type}.json", paper_ids
+        )
+        checkpoint.close()
+    print(f"Summaries generated'")
+    print("--------------------------")
@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import time
+
+from asgiref.sync import async_to_sync
+
+import cot_summarization
+from checkpoint import Checkpoint
+from client import add_client_arguments, client_options
+from corpus import load_corpus
+from eval_store import EvaluationStore, parse_score
+from failures import DeadLetters, add_failure_arguments
+from instrumentation import add_instrumentation_arguments, instrumented
+from pipeline import CONFIGURATIONS, run_pipeline
+from prompts import add_prompt_arguments, load_prompts
+
+
+def summary_path(output_dir, method, summary_type, extension):
+    return os.path.join(
+        output_dir, f"{method}_generated_summaries_{summary_type}.{extension}"
+    )
+
+
+def reset_outputs(output_dir, configurations):
+    for configuration in configurations:
+        path = summary_path(output_dir, *configuration, "jsonl")
+        if os.path.exists(path):
+            os.remove(path)
+    path = os.path.join(output_dir, "evaluations.jsonl")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def export_outputs(output_dir, configurations, paper_ids, store):
+    for configuration in configurations:
+        checkpoint = Checkpoint(summary_path(output_dir, *configuration, "jsonl"))
+        checkpoint.export(summary_path(output_dir, *configuration, "json"), paper_ids)
+        checkpoint.close()
+
+    with open(
+        os.path.join(output_dir, "evaluations.jsonl"), "r", encoding="utf-8"
+    ) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    store.record_many(
+        [
+            (
+                record["id"],
+                record["method"],
+                record["summary_type"],
+                parse_score(record["response"]),
+                record["response"],
+            )
+            for record in records
+        ]
+    )
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    add_prompt_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_failure_arguments(parser, retry=False)
+    parser.add_argument("--corpus", default="papers.json")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--summarize-workers", type=int, default=32)
+    parser.add_argument("--evaluate-workers", type=int, default=32)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument(
+        "--cot-mode", choices=sorted(cot_summarization.TASKS), default="linear"
+    )
+    parser.add_argument("--store", default="evaluations.sqlite")
+    args = parser.parse_args()
+    if args.prompts is not None:
+        load_prompts(args.prompts)
+
+    papers = load_corpus(args.corpus)
+    os.makedirs(args.output_dir, exist_ok=True)
+    reset_outputs(args.output_dir, CONFIGURATIONS)
+
+    dead_letters = DeadLetters(args.dead_letters)
+    started = time.monotonic()
+    with instrumented(args):
+        report = async_to_sync(run_pipeline)(
+            papers=papers,
+            configurations=CONFIGURATIONS,
+            output_dir=args.output_dir,
+            summarize_workers=args.summarize_workers,
+            evaluate_workers=args.evaluate_workers,
+            queue_size=args.queue_size,
+            cot_mode=args.cot_mode,
+            dead_letters=dead_letters,
+            **client_options(args),
+        )
+    dead_letters.close()
+    print(f"Stages: {report}")
+    print(
+        f"Swept {len(CONFIGURATIONS)} configurations over {len(papers)} papers "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+
+    store = EvaluationStore(args.store)
+    evaluated = export_outputs(args.output_dir, CONFIGURATIONS, papers.ids(), store)
+    print(f"Recorded {evaluated} evaluations in {args.store}")
+    summary, differences = store.summary()
+    for label, stats in {**summary, **differences}.items():
+        print(label, stats)
+    store.close()
@@ -0,0 +1,48 @@
+import json
+
+from checkpoint import Checkpoint
+
+
+def test_torn_last_line_is_skipped_and_later_appends_survive(tmp_path):
+    path = tmp_path / "summaries.jsonl"
+    path.write_text('{"id": "a", "pred_summary": "first"}\n{"id": "b", "pred_su')
+
+    checkpoint = Checkpoint(str(path))
+    checkpoint.append({"id": "c", "pred_summary": "third"})
+    checkpoint.close()
+
+    assert Checkpoint(str(path)).completed_ids() == {"a", "c"}
+    lines = path.read_text().splitlines()
+    assert json.loads(lines[-1]) == {"id": "c", "pred_summary": "third"}
+
+
+def test_completed_ids_filter_on_fields(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "evaluations.jsonl"))
+    checkpoint.append({"id": "a", "method": "zero_shot"})
+    checkpoint.append({"id": "b", "method": "few_shot"})
+    assert checkpoint.completed_ids(method="few_shot") == {"b"}
+    checkpoint.close()
+
+
+def test_export_keeps_the_last_record_in_id_order(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "summaries.jsonl"))
+    checkpoint.append({"id": "a", "pred_summary": "old"})
+    checkpoint.append({"id": "b", "pred_summary": "b"})
+    checkpoint.append({"id": "a", "pred_summary": "new"})
+    exported = tmp_path / "summaries.json"
+    checkpoint.export(str(exported), ["b", "missing", "a"])
+    checkpoint.close()
+
+    records = json.loads(exported.read_text(encoding="utf-16"))
+    assert records == [
+        {"id": "b", "pred_summary": "b"},
+        {"id": "a", "pred_summary": "new"},
+    ]
+
+
+def test_export_of_nothing_is_an_empty_list(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "summaries.jsonl"))
+    exported = tmp_path / "summaries.json"
+    checkpoint.export(str(exported))
+    checkpoint.close()
+    assert json.loads(exported.read_text(encoding="utf-16")) == []
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+
+from backends import DEFAULT_BACKEND
+from cot_summarization import TASKS, summarization_task
+from failures import RequestFailed
+
+PAPER = {
+    "id": "paper",
+    "title": "Graph neural networks",
+    "summary": "",
+    "document": [
+        {"subtitle": "Introduction", "text": "Graph neural networks pass messages."},
+        {"subtitle": "Background", "text": "Neural networks pass messages on graphs."},
+        {"subtitle": "Method", "text": "A sparse attention kernel halves latency."},
+    ],
+}
+
+
+class FakeClient:
+    backend = DEFAULT_BACKEND
+
+    def __init__(self, paper=PAPER, failing=()):
+        self.paper = paper
+        self.failing = failing
+        self.texts = []
+
+    async def post(self, payload):
+        body = json.dumps(payload)
+        # Upper tree levels only send summaries, so they match no section.
+        text = next(
+            (doc["text"] for doc in self.paper["document"] if doc["text"] in body),
+            None,
+        )
+        self.texts.append(text)
+        if text in self.failing:
+            raise RequestFailed("server_error", "HTTP 500", 500)
+        return f"Summary {len(self.texts)}: graph neural networks pass messages."
+
+
+def summarize(**options):
+    client = FakeClient()
+    result = asyncio.run(summarization_task(client, PAPER, **options))
+    return client.texts, result
+
+
+def test_every_section_is_summarized_by_default():
+    texts, result = summarize()
+    assert texts == [doc["text"] for doc in PAPER["document"]]
+    assert result["calls_saved"] == 0
+
+
+def test_section_with_new_material_is_still_refined():
+    texts, result = summarize(min_novelty=0.5)
+    # The background section only repeats what the summary already says; the
+    # method section brings new terms and must still reach the model.
+    assert texts == [PAPER["document"][0]["text"], PAPER["document"][2]["text"]]
+    assert result["calls_saved"] == 1
+
+
+def test_repeated_section_is_sent_once():
+    method = "A sparse attention kernel halves latency on long sequences. " * 4
+    paper = {
+        **PAPER,
+        "document": [
+            *PAPER["document"][:2],
+            {"subtitle": "Method", "text": method},
+            {"subtitle": "Method again", "text": method},
+        ],
+    }
+    client = FakeClient(paper)
+    asyncio.run(summarization_task(client, paper))
+    assert client.texts == [doc["text"] for doc in paper["document"][:3]]
+
+
+def test_boilerplate_sections_are_skipped_only_on_request():
+    paper = {
+        **PAPER,
+        "document": [
+            *PAPER["document"],
+            {"subtitle": "Funding Allocation Model", "text": "Budgets follow demand."},
+            {"subtitle": "References", "text": "[1] Vaswani et al. Attention."},
+        ],
+    }
+    client = FakeClient(paper)
+    asyncio.run(summarization_task(client, paper))
+    assert client.texts == [doc["text"] for doc in paper["document"]]
+
+    client = FakeClient(paper)
+    asyncio.run(summarization_task(client, paper, skip_boilerplate=True))
+    assert client.texts == [doc["text"] for doc in paper["document"][:-1]]
+
+
+def test_paper_without_text_fails_in_both_modes():
+    paper = {**PAPER, "document": [{"subtitle": "Intro", "text": " "}]}
+    for task in TASKS.values():
+        client = FakeClient(paper)
+        with pytest.raises(RequestFailed):
+            asyncio.run(task(client, paper))
+        assert client.texts == []
+
+
+@pytest.mark.parametrize("task", sorted(TASKS))
+@pytest.mark.parametrize("failing", [2, 3, 4])
+def test_failed_sections_are_document_indices(task, failing):
+    paper = {
+        **PAPER,
+        "document": [
+            PAPER["document"][0],
+            {"subtitle": "References", "text": "[1] Vaswani et al. Attention."},
+            *PAPER["document"][1:],
+            {"subtitle": "Results", "text": "Latency drops on every benchmark."},
+        ],
+    }
+    client = FakeClient(paper, failing={paper["document"][failing]["text"]})
+    result = asyncio.run(TASKS[task](client, paper, skip_boilerplate=True))
+    assert [failure["section"] for failure in result["failed_sections"]] == [failing]
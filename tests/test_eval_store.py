@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import eval_store
+from eval_store import EvaluationStore, bootstrap_means, parse_score
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("0.8", 0.8),
+        ("  **7/10**\n", 0.7),
+        ("85%", 0.85),
+        ("0.7.", 0.7),
+        ('"1.00"', 1.0),
+        ("Score: 9/10", 0.9),
+        ("The score is **0.65** overall.", 0.65),
+        ("Section 3 is weak. Score: 0.4", 0.4),
+        ("Score: 12. Final score: 0.3", 0.3),
+        ("There are 3 sections. Overall good.", None),
+        ("I'd say 2 out of 3", None),
+        ("7", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_score(text, expected):
+    assert parse_score(text) == (None if expected is None else pytest.approx(expected))
+
+
+def test_bootstrap_chunks_do_not_change_the_means(monkeypatch):
+    values = np.random.default_rng(1).random(50)
+    whole = bootstrap_means(values, 1000, np.random.default_rng(0))
+    monkeypatch.setattr(eval_store, "BOOTSTRAP_CELLS", 77)
+    chunked = bootstrap_means(values, 1000, np.random.default_rng(0))
+    assert np.allclose(whole, chunked)
+    assert bootstrap_means(values, 0, np.random.default_rng(0)).shape == (0,)
+    assert np.isnan(bootstrap_means(np.array([np.nan]), 3, None)).all()
+
+
+def test_store_summary(tmp_path):
+    store = EvaluationStore(str(tmp_path / "scores.sqlite"))
+    store.record_many(
+        [
+            ("p1", "zero_shot", "abstractive", 0.8, "0.8"),
+            ("p2", "zero_shot", "abstractive", 0.6, "0.6"),
+            ("p1", "few_shot", "abstractive", 0.4, "0.4"),
+        ]
+    )
+    summary, _ = store.summary(resamples=100)
+    store.close()
+    assert summary["zero_shot-abstractive"]["n"] == 2
+    assert summary["zero_shot-abstractive"]["mean"] == pytest.approx(0.7)
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+import pytest
+
+from backends import DEFAULT_BACKEND
+from evaluate import evaluate_paper_batch, parse_batch_scores
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("A: 0.8\nB: 0.3", ["0.8", "0.3"]),
+        ("**Summary A**: 0.5\n- Candidate (B) = 1.0", ["0.5", "1.0"]),
+        ("A: 7\nB: 0.4", [None, "0.4"]),
+        ("A: 0.2\nA: 0.9", ["0.2", None]),
+        ("A: 0.6\nC: 0.5", ["0.6", None]),
+        ("Summary A scored 0.6", [None, None]),
+        ("", [None, None]),
+        (None, [None, None]),
+    ],
+)
+def test_parse_batch_scores(text, expected):
+    assert parse_batch_scores(text, 2) == expected
+
+
+class FakeClient:
+    backend = DEFAULT_BACKEND
+
+    def __init__(self, batch_response):
+        self.batch_response = batch_response
+
+    async def post(self, payload):
+        if "Summary A:" in json.dumps(payload):
+            return self.batch_response
+        return "Score: 0.25"
+
+
+def test_batch_and_fallback_judgements_are_score_and_response():
+    judgements, fallbacks, failures = asyncio.run(
+        evaluate_paper_batch(FakeClient("A: 0.9"), "truth", ["first", "second"])
+    )
+    assert judgements == [(0.9, "A: 0.9"), (0.25, "Score: 0.25")]
+    assert fallbacks == 1
+    assert failures == {}
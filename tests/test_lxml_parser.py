@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+import lxml_parser
+import scrap_for_paper
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "ar5iv")
+PAGES = sorted(name for name in os.listdir(FIXTURES) if name.endswith(".html"))
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), "rb") as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_lxml_parser_matches_html_parser(name):
+    url = f"https://ar5iv.labs.arxiv.org/html/{name}"
+    expected = scrap_for_paper.parse_paper(load(name), url)
+    actual = lxml_parser.parse_paper(load(name), url)
+
+    assert actual["title"] == expected["title"]
+    assert actual["summary"] == expected["summary"]
+    assert [section["subtitle"] for section in actual["document"]] == [
+        section["subtitle"] for section in expected["document"]
+    ]
+    for old, new in zip(expected["document"], actual["document"]):
+        assert new["text"] == old["text"]
+    assert actual["id"] == expected["id"]
+
+
+def test_fixtures_cover_nested_sections():
+    sections = lxml_parser.parse_paper(load("nested_sections.html"), "url")["document"]
+    assert len(sections) == 6
+    assert all(section["text"] for section in sections)
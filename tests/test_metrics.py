@@ -0,0 +1,111 @@
+import math
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import metrics
+
+WORDS = ["graph", "model", "the", "a", "attention", "loss", "layer", "data"]
+LENGTHS = [0, 1, 2, 63, 64, 65, 130]
+
+
+def text(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def grams(tokens, n):
+    return Counter(tuple(tokens[idx : idx + n]) for idx in range(len(tokens) - n + 1))
+
+
+def f1(overlap, reference_total, candidate_total):
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / candidate_total, overlap / reference_total
+    return 2 * precision * recall / (precision + recall)
+
+
+def lcs(first, second):
+    previous = [0] * (len(second) + 1)
+    for token in first:
+        current = [0]
+        for idx, other in enumerate(second):
+            current.append(
+                previous[idx] + 1
+                if token == other
+                else max(previous[idx + 1], current[-1])
+            )
+        previous = current
+    return previous[-1]
+
+
+def brute_force(reference, candidate):
+    reference, candidate = metrics.tokenize(reference), metrics.tokenize(candidate)
+    scores = {}
+    log_precisions = 0.0
+    for n in range(1, 5):
+        overlap = sum((grams(reference, n) & grams(candidate, n)).values())
+        reference_total = max(len(reference) - n + 1, 0)
+        candidate_total = max(len(candidate) - n + 1, 0)
+        if n <= 2:
+            scores[f"rouge{n}"] = f1(overlap, reference_total, candidate_total)
+        smoothing = 0 if n == 1 else 1
+        log_precisions += math.log(
+            max(overlap + smoothing, 1e-9) / max(candidate_total + smoothing, 1)
+        )
+    brevity = (
+        1.0
+        if len(candidate) >= len(reference)
+        else math.exp(1 - len(reference) / max(len(candidate), 1))
+    )
+    scores["bleu"] = brevity * math.exp(log_precisions / 4) if candidate else 0.0
+    scores["rougeL"] = f1(lcs(reference, candidate), len(reference), len(candidate))
+    reference = [token for token in reference if token not in metrics.ARTICLES]
+    candidate = [token for token in candidate if token not in metrics.ARTICLES]
+    overlap = sum((Counter(reference) & Counter(candidate)).values())
+    scores["token_f1"] = f1(overlap, len(reference), len(candidate))
+    return scores
+
+
+def test_scores_match_brute_force():
+    rng = random.Random(0)
+    pairs = [
+        (text(rng, reference_length), text(rng, candidate_length))
+        for reference_length in LENGTHS
+        for candidate_length in LENGTHS
+    ]
+    pairs += [(text(rng, 40), text(rng, 25)) for _ in range(50)]
+    scores = metrics.score(*zip(*pairs))
+    for idx, pair in enumerate(pairs):
+        for name, expected in brute_force(*pair).items():
+            assert scores[name][idx] == pytest.approx(expected), (name, pair)
+
+
+def test_identical_texts_score_one():
+    scores = metrics.score(["graph attention model"], ["Graph attention, model."])
+    for name in ("rouge1", "rouge2", "rougeL", "token_f1"):
+        assert scores[name][0] == pytest.approx(1.0)
+
+
+def test_empty_input():
+    assert all(len(values) == 0 for values in metrics.score([], []).values())
+
+
+@pytest.mark.parametrize("max_cells", [1, 1 << 10, 1 << 24])
+def test_lcs_lengths_match_dynamic_programming(max_cells):
+    rng = random.Random(1)
+    references, candidates = [], []
+    for reference_length in LENGTHS:
+        for candidate_length in LENGTHS:
+            references.append([rng.randrange(4) for _ in range(reference_length)])
+            candidates.append([rng.randrange(4) for _ in range(candidate_length)])
+    lengths = metrics.lcs_lengths(
+        [np.array(tokens, dtype=np.uint64) for tokens in references],
+        [np.array(tokens, dtype=np.uint64) for tokens in candidates],
+        max_cells=max_cells,
+    )
+    assert list(lengths) == [
+        lcs(reference, candidate)
+        for reference, candidate in zip(references, candidates)
+    ]
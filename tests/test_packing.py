@@ -0,0 +1,47 @@
+import pytest
+
+from backends import DEFAULT_BACKEND
+from client import estimate_tokens
+from packing import pack_texts, prompt_token_budget, split_text
+from summarization import generate_payload
+
+SENTENCES = " ".join(f"Sentence number {idx} is here." for idx in range(40))
+
+
+@pytest.mark.parametrize("token_budget", [0, -5])
+def test_split_text_rejects_budgets_below_one(token_budget):
+    with pytest.raises(ValueError):
+        split_text("Some text.", token_budget)
+
+
+def test_short_text_is_one_piece():
+    assert split_text("Short text.", 100) == ["Short text."]
+
+
+@pytest.mark.parametrize("token_budget", [1, 3, 10, 50])
+def test_pieces_fit_the_budget_and_keep_every_word(token_budget):
+    pieces = split_text(SENTENCES, token_budget)
+    assert all(estimate_tokens(piece) <= token_budget for piece in pieces)
+    assert "".join("".join(pieces).split()) == "".join(SENTENCES.split())
+
+
+def test_unbroken_text_is_cut_by_characters():
+    pieces = split_text("x" * 100, 5)
+    assert pieces == ["x" * 20] * 5
+
+
+def test_pack_texts_skips_blank_texts_and_fills_chunks():
+    chunks = pack_texts(["", "   ", "first text.", "second text."], 100)
+    assert chunks == ["first text.\n\nsecond text."]
+    assert pack_texts(["", " \n"], 100) == []
+
+
+def test_prompt_token_budget_leaves_room_for_text():
+    payload = generate_payload("", "zero_shot", "abstractive")
+    assert prompt_token_budget(payload, DEFAULT_BACKEND) >= 1
+
+
+def test_prompt_token_budget_rejects_prompts_without_room():
+    payload = generate_payload("x" * 10**6, "zero_shot", "abstractive")
+    with pytest.raises(ValueError):
+        prompt_token_budget(payload, DEFAULT_BACKEND)
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from backends import DEFAULT_BACKEND
+from failures import RequestFailed
+from summarization import summarize_paper
+
+
+class FakeClient:
+    backend = DEFAULT_BACKEND
+
+    def __init__(self):
+        self.calls = 0
+
+    async def post(self, payload):
+        self.calls += 1
+        return "A summary."
+
+
+@pytest.mark.parametrize("document", [[], [{"subtitle": "Intro", "text": "  \n"}]])
+def test_paper_without_text_fails_instead_of_summarizing_none(document):
+    paper = {"id": "paper", "title": "Title", "summary": "", "document": document}
+    client = FakeClient()
+    with pytest.raises(RequestFailed) as failure:
+        asyncio.run(summarize_paper(client, paper, "zero_shot", "abstractive"))
+    assert failure.value.kind == "no_text"
+    assert client.calls == 0
+
+
+def test_paper_with_text_is_summarized():
+    paper = {
+        "id": "paper",
+        "title": "Title",
+        "summary": "",
+        "document": [{"subtitle": "Intro", "text": "We study caching."}],
+    }
+    result = asyncio.run(
+        summarize_paper(FakeClient(), paper, "zero_shot", "abstractive")
+    )
+    assert result["pred_summary"] == "A summary."